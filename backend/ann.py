@@ -0,0 +1,86 @@
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+
+# V5.0: Approximate nearest-neighbour index for very large catalogs
+class IVFIndex:
+    """
+    Inverted-file index over compact book embeddings.
+
+    1. TF-IDF rows are compressed with truncated SVD (LSA) into small float32
+       vectors and L2-normalised, so a dot product is a cosine similarity.
+    2. Spherical k-means splits the embeddings into `n_lists` partitions.
+    3. A query only scores the books in the `n_probe` partitions whose centroids
+       are closest to it. Raising `n_probe` trades speed for recall.
+    """
+
+    def __init__(self, tfidf_matrix, n_components=128, n_lists=None, n_probe=8,
+                 kmeans_iterations=10, seed=0):
+        num_books, num_terms = tfidf_matrix.shape
+        rng = np.random.default_rng(seed)
+
+        # 1. Embed: SVD needs fewer components than both matrix dimensions
+        n_components = max(1, min(n_components, num_books - 1, num_terms - 1))
+        self.svd = TruncatedSVD(n_components=n_components, random_state=seed)
+        self.embeddings = _normalize(self.svd.fit_transform(tfidf_matrix).astype(np.float32))
+
+        # 2. Partition: ~sqrt(N) lists keeps both the centroid scan and the lists short
+        if n_lists is None:
+            n_lists = int(np.sqrt(num_books))
+        self.n_lists = max(1, min(n_lists, num_books))
+        self.n_probe = n_probe
+        self.centroids = _spherical_kmeans(self.embeddings, self.n_lists, kmeans_iterations, rng)
+
+        # 3. Inverted lists stored as one array of rows grouped by partition
+        labels = _assign(self.embeddings, self.centroids)
+        self.rows = np.argsort(labels, kind='stable').astype(np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=self.n_lists))))
+
+    def candidates(self, liked_rows, n_probe=None):
+        """
+        Returns (rows, scores) for every book in the partitions probed for the
+        user profile built from `liked_rows`.
+        """
+        # The user profile is the sum of the liked embeddings, as in the exact path
+        query = self.embeddings[liked_rows].sum(axis=0)
+        query /= max(np.linalg.norm(query), 1e-12)
+
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+
+        rows = np.concatenate([self.rows[self.offsets[l]:self.offsets[l + 1]] for l in probed])
+        return rows, self.embeddings[rows] @ query
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _assign(embeddings, centroids, chunk_size=65536):
+    # Chunked so the (chunk x n_lists) similarity block stays small
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), chunk_size):
+        block = embeddings[start:start + chunk_size] @ centroids.T
+        labels[start:start + chunk_size] = block.argmax(axis=1)
+    return labels
+
+def _spherical_kmeans(embeddings, n_lists, iterations, rng, sample_per_list=64):
+    # Train on a sample; assigning the full catalog happens once afterwards
+    sample_size = min(len(embeddings), n_lists * sample_per_list)
+    sample = embeddings[rng.choice(len(embeddings), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+
+        # Re-seed empty partitions with random sample points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = _normalize(sums)
+
+    return centroids
@@ -2,34 +2,86 @@ from flask import Flask
 from extensions import db
 from database import init_db
 from seed import seed_data
+from cache import init_recommendation_cache
+from commands import register_commands
+from interactions import init_group_commit
+from metrics import init_metrics
+from collaborative import init_cf_engine
 
-def create_app():
-    """Construct the core application."""
+def create_app(config=None):
+    """Construct the core application. `config` overrides the defaults below."""
     # 1. Create the Flask app instance
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///books.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # V5.0: Recommendation engine. 'exact' scores the whole catalog,
+    # 'ann' serves top-k from an IVF index (see ann.py); raise n_probe for
+    # better recall, lower it for speed (benchmarks/ann.py measures both).
+    app.config['RECOMMENDER_ENGINE'] = 'exact'
+    app.config['ANN_OPTIONS'] = {'n_components': 128, 'n_probe': 16}
+
+    # V5.0: Blend of content (TF-IDF) and collaborative (item-item) scores.
+    # Each process keeps its own item-item matrix and re-reads the users other
+    # processes changed every CF_SYNC_SECONDS (0 = never, for a single process).
+    app.config['RECOMMENDER_WEIGHTS'] = {'content': 0.7, 'collaborative': 0.3}
+    app.config['CF_SYNC_SECONDS'] = 5.0
+
+    # V5.4: Lists from `flask precompute-recommendations` are served for this long
+    app.config['PRECOMPUTED_MAX_AGE'] = 24 * 60 * 60
+
+    # V5.0: Per-user recommendation cache ('local' in-process LRU or shared 'redis')
+    app.config['RECOMMENDATION_CACHE_BACKEND'] = 'local'
+    app.config['RECOMMENDATION_CACHE_SIZE'] = 10000
+    app.config['RECOMMENDATION_CACHE_TTL'] = 300
+    app.config['RECOMMENDATION_CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
+
+    # V5.3: Coalesce single /users/interact writes arriving within this many
+    # milliseconds into one transaction (0 = commit each request on its own)
+    app.config['INTERACTION_GROUP_COMMIT_MS'] = 0
+
+    # V5.7: Instrumentation (see metrics.py). Statements slower than this are
+    # logged; profiling is off unless requested: PROFILE_REQUESTS honours
+    # ?profile=1 on any request, PROFILE_SAMPLE_RATE profiles that fraction
+    # of all requests. Profiles are written to PROFILE_DIR as .prof files.
+    app.config['SLOW_QUERY_SECONDS'] = 0.1
+    app.config['PROFILE_REQUESTS'] = False
+    app.config['PROFILE_SAMPLE_RATE'] = 0.0
+    app.config['PROFILE_DIR'] = 'profiles'
+
+    if config:
+        app.config.update(config)
+
     # 2. Initialize extensions
     # The 'db' object from extensions.py is now tied to the app.
     db.init_app(app)
+    init_recommendation_cache(app)
+    register_commands(app)
+    init_group_commit(app)
+    init_metrics(app)
 
     # 3. Import and register blueprints
     # These are imported *after* the app is created and configured.
     from routes.books import books_bp
     from routes.users import users_bp
     from routes.recommendations import recommendations_bp
+    from routes.metrics import metrics_bp
     app.register_blueprint(books_bp)
     app.register_blueprint(users_bp)
     app.register_blueprint(recommendations_bp)
+    app.register_blueprint(metrics_bp)
 
     # 4. Create an application context before running database operations
     with app.app_context():
         # Initialize and seed the database
         # This ensures that the application context is available for db.create_all()
-        # V2.0: Only re-seed if force is needed, but for now we re-seed to apply changes
+        # V5.2: Both steps are idempotent: tables are only created if missing and
+        # seeding only happens on an empty catalog. Use `flask seed --reset` to start over.
         init_db()
-        seed_data() 
+        seed_data()
+
+    # V5.0: The item-item matrix is built in the background (see collaborative.py)
+    init_cf_engine(app)
 
     # 5. Return the fully configured app instance
     return app
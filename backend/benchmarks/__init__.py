@@ -0,0 +1,2 @@
+# Standalone benchmarks for the backend. Run them from the backend directory,
+# e.g. `python -m benchmarks.scoring`.
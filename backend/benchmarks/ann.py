@@ -0,0 +1,76 @@
+"""
+Accuracy/speed benchmark for the approximate (IVF) engine.
+
+Builds the exact and the ANN recommender over the same synthetic catalog and,
+for a range of n_probe values (with or without exact re-ranking), reports recall@k against the exact top-k and
+the median latency of both paths.
+
+    python -m benchmarks.ann --books 200000 --probes 1 4 8 16 32
+"""
+import argparse
+import json
+import random
+import time
+import numpy as np
+from recommendation import ContentRecommender
+from benchmarks.scoring import make_books, make_catalog
+
+def sample_liked_sets(books, num_users, num_liked, seed=1):
+    # Users like books from one category, so their profiles have a real neighbourhood
+    rng = random.Random(seed)
+    by_category = {}
+    for book in books:
+        by_category.setdefault(book['category'], []).append(book['id'])
+    liked_sets = []
+    for _ in range(num_users):
+        ids = by_category[rng.choice(sorted(by_category))]
+        liked_sets.append(rng.sample(ids, min(num_liked, len(ids))))
+    return liked_sets
+
+def timed(fn, liked_sets, k):
+    results, timings = [], []
+    for liked in liked_sets:
+        start = time.perf_counter()
+        results.append({book['id'] for book in fn(liked, k)})
+        timings.append(time.perf_counter() - start)
+    return results, 1000 * float(np.median(timings))
+
+def run(num_books, probes, k, num_users, num_liked, n_components, n_lists, rerank):
+    books = make_books(num_books)
+    liked_sets = sample_liked_sets(books, num_users, num_liked)
+
+    catalog = make_catalog(books)
+    exact = ContentRecommender(catalog)
+    start = time.perf_counter()
+    approx = ContentRecommender(catalog, engine='ann',
+                                ann_options={'n_components': n_components, 'n_lists': n_lists, 'rerank': rerank})
+    build_s = time.perf_counter() - start
+
+    truth, exact_ms = timed(exact.score, liked_sets, k)
+    print(json.dumps({'books': num_books, 'ann_build_s': build_s, 'exact_ms': exact_ms}))
+
+    rows = []
+    for n_probe in probes:
+        approx.ann_index.n_probe = n_probe
+        found, ann_ms = timed(approx.score, liked_sets, k)
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+        rows.append({'n_probe': n_probe, f'recall@{k}': float(recall), 'ann_ms': ann_ms})
+        print(json.dumps(rows[-1]))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--liked', type=int, default=5)
+    parser.add_argument('--components', type=int, default=128)
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--no-rerank', dest='rerank', action='store_false',
+                        help='rank candidates by embedding similarity only')
+    args = parser.parse_args()
+    run(args.books, args.probes, args.k, args.users, args.liked, args.components, args.lists, args.rerank)
+
+if __name__ == '__main__':
+    main()
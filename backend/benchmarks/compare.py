@@ -0,0 +1,68 @@
+"""
+Compares two benchmarks.load result files, scenario by scenario.
+
+Prints every metric of the baseline next to the current run with the
+relative change, and flags changes for the worse beyond --threshold.
+Exits with status 1 if there is any, so it can gate CI.
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# metric -> True if higher is better
+METRICS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'peak_rss_mb': False,
+    'errors': False,
+}
+
+def compare(baseline, current, threshold):
+    """Returns (rows, regressions); a row is (scenario, metric, base, head, change)."""
+    rows, regressions = [], []
+    for scenario in sorted(baseline['scenarios'].keys() & current['scenarios'].keys()):
+        base, head = baseline['scenarios'][scenario], current['scenarios'][scenario]
+        for metric, higher_is_better in METRICS.items():
+            if metric not in base or metric not in head:
+                continue
+            change = (head[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            worse = change < -threshold if higher_is_better else change > threshold
+            if metric == 'errors':
+                worse = head[metric] > base[metric]
+            rows.append((scenario, metric, base[metric], head[metric], change))
+            if worse:
+                regressions.append(rows[-1])
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for key in ('books', 'users', 'threads', 'requests_per_thread', 'config'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f"warning: runs differ in {key}: {baseline['meta'].get(key)} vs {current['meta'].get(key)}")
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print(f"{'scenario':<18}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for row in rows:
+        scenario, metric, base, head, change = row
+        flag = '  <-- worse' if row in regressions else ''
+        print(f"{scenario:<18}{metric:<16}{base:>12.2f}{head:>12.2f}{change:>+10.1%}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
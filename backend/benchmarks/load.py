@@ -0,0 +1,252 @@
+"""
+Concurrent load benchmark of the Flask app, in-process.
+
+Builds a fresh database in a temporary directory (synthetic catalog through
+the importer, Zipf-distributed interactions), then drives the app's test
+client from several threads, one scenario at a time. Each scenario reports
+throughput, p50/p95/p99 latency, errors and the peak RSS of the process
+while it ran, plus recommendation latencies split by where the list came
+from (cache hit, precomputed or computed). Results are written as JSON for
+benchmarks.compare.
+
+    python -m benchmarks.load --books 100000 --users 20000 --threads 8 --output results/100k.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from sqlalchemy import select
+from app import create_app
+from collaborative import get_cf_engine
+from extensions import db
+from importer import import_catalog
+from models import Book, User, UserInteraction
+from benchmarks.synthetic import CATEGORIES, generate_books, generate_interactions
+
+# name -> function(rng, context) returning (method, path, json body or None)
+SCENARIOS = {
+    'books_page': lambda rng, ctx: ('GET', f"/books?limit=50&after={rng.randrange(ctx['max_book_id'])}", None),
+    'books_category': lambda rng, ctx: (
+        'GET', f"/books/category/{rng.choice(CATEGORIES)}?limit=50&after={rng.randrange(ctx['max_book_id'])}", None
+    ),
+    'recommendations': lambda rng, ctx: ('GET', f"/recommendations/{ctx['pick_user'](rng)}", None),
+    'interact': lambda rng, ctx: ('POST', '/users/interact', {
+        'user_id': ctx['pick_user'](rng),
+        'book_id': ctx['book_ids'][min(int(rng.paretovariate(1.2)) - 1, len(ctx['book_ids']) - 1)],
+        'type': rng.choice(('favorite', 'read')),
+    }),
+}
+# The 'mixed' scenario draws from the others with these weights
+MIX = {'books_page': 0.3, 'books_category': 0.2, 'recommendations': 0.4, 'interact': 0.1}
+# Zipf exponent of how often each user shows up, over all users
+USER_SKEW = 1.1
+
+
+class RssSampler:
+    """Tracks the peak resident set size of this process while running."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # No procfs: fall back to the lifetime peak (kilobytes on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def build_database(app, num_books, num_users, mean_interactions, seed):
+    """Imports the synthetic catalog and interactions; returns setup timings and counts."""
+    setup = {}
+    with app.app_context():
+        start = time.perf_counter()
+        stats = import_catalog(generate_books(num_books, seed=seed))
+        setup['import_s'] = time.perf_counter() - start
+        setup['books'] = db.session.scalar(select(db.func.count(Book.id)))
+        setup['import_rows_per_s'] = stats['rows_per_second']
+
+        start = time.perf_counter()
+        book_ids = db.session.scalars(select(Book.id).order_by(Book.popularity.desc(), Book.id)).all()
+        db.session.execute(User.__table__.insert(), [{'id': u} for u in range(1, num_users + 1)])
+        interactions = generate_interactions(book_ids, num_users, mean_interactions, seed=seed)
+        setup['interactions'] = 0
+        while chunk := list(islice(interactions, 50000)):
+            db.session.execute(
+                UserInteraction.__table__.insert(),
+                [{'user_id': u, 'book_id': b, 'interaction_type': t} for u, b, t in chunk],
+            )
+            setup['interactions'] += len(chunk)
+        db.session.commit()
+        setup['interactions_s'] = time.perf_counter() - start
+    return setup, book_ids
+
+def run_scenario(app, name, context, threads, requests_per_thread, seed):
+    """Runs one scenario from `threads` threads; returns its measurements."""
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = app.test_client()
+        latencies, errors, by_source = [], 0, {}
+        for _ in range(requests_per_thread):
+            scenario = name if name != 'mixed' else rng.choices(list(MIX), weights=list(MIX.values()))[0]
+            method, path, body = SCENARIOS[scenario](rng, context)
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()   # consume streamed bodies too
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+            # Recommendations tell whether they were a cache hit, precomputed or computed
+            source = response.headers.get('X-Recommendation-Source')
+            if source is not None:
+                by_source.setdefault(source, []).append(latencies[-1])
+        return latencies, errors, by_source
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.concatenate([np.asarray(l) for l, _, _ in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    by_source = {}
+    for _, _, sources in results:
+        for source, values in sources.items():
+            by_source.setdefault(source, []).extend(values)
+    return {
+        'requests': int(latencies.size),
+        'errors': int(sum(e for _, e, _ in results)),
+        'seconds': elapsed,
+        'throughput_rps': latencies.size / elapsed,
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(latencies.max()),
+        'peak_rss_mb': rss.peak / 2 ** 20,
+        'recommendations_by_source': {
+            source: _percentiles(np.asarray(values) * 1000) for source, values in sorted(by_source.items())
+        },
+    }
+
+def _percentiles(latencies_ms):
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {'requests': int(latencies_ms.size), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(num_books, num_users, mean_interactions, threads, requests_per_thread, scenarios, seed, config=None):
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            **(config or {}),
+        })
+        setup, book_ids = build_database(app, num_books, num_users, mean_interactions, seed)
+        print(json.dumps({'setup': setup}), flush=True)
+
+        # Users are picked with a Zipf distribution bounded to 1..num_users, so
+        # hot users hit the recommendation cache while the long tail misses it
+        user_cdf = np.cumsum(1.0 / np.arange(1, num_users + 1) ** USER_SKEW)
+        user_cdf /= user_cdf[-1]
+        context = {
+            'max_book_id': max(book_ids),
+            'book_ids': book_ids,
+            'pick_user': lambda rng: int(np.searchsorted(user_cdf, rng.random(), side='right')) + 1,
+        }
+
+        # Warm-up: snapshot load, model fit, CF build, leaderboards. The CF
+        # engine built itself at startup, before the interactions were inserted
+        start = time.perf_counter()
+        with app.app_context():
+            get_cf_engine(wait=True).rebuild()
+        client = app.test_client()
+        for name in SCENARIOS:
+            method, path, body = SCENARIOS[name](random.Random(seed), context)
+            client.open(path, method=method, json=body).get_data()
+        setup['warmup_s'] = time.perf_counter() - start
+
+        results = {}
+        for name in scenarios:
+            results[name] = run_scenario(app, name, context, threads, requests_per_thread, seed)
+            print(json.dumps({name: results[name]}), flush=True)
+
+    return {
+        'meta': {
+            'books': num_books,
+            'users': num_users,
+            'mean_interactions': mean_interactions,
+            'threads': threads,
+            'requests_per_thread': requests_per_thread,
+            'seed': seed,
+            'config': config or {},
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'setup': setup,
+        'scenarios': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000, help='catalog size, e.g. 10000, 100000 or 1000000')
+    parser.add_argument('--users', type=int, default=None, help='default: books / 5')
+    parser.add_argument('--interactions', type=float, default=10, help='mean interactions per user')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='requests per thread and scenario')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS) + ['mixed'],
+                        choices=list(SCENARIOS) + ['mixed'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--config', type=json.loads, default=None,
+                        help='JSON object of app config overrides, e.g. \'{"RECOMMENDER_ENGINE": "ann"}\'')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.books, args.users or max(1, args.books // 5), args.interactions, args.threads,
+                  args.requests, args.scenarios, args.seed, args.config)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
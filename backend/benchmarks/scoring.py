@@ -0,0 +1,78 @@
+"""
+Memory/latency benchmark for the recommendation scoring step.
+
+Fits a ContentRecommender on synthetic catalogs of growing size and measures,
+per scoring call, the wall time and the peak memory allocated (tracemalloc).
+The old dense N x N cosine_similarity path is measured alongside it for the
+sizes where it still fits in memory.
+
+    python -m benchmarks.scoring --sizes 1000 10000 100000 --dense-limit 5000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from catalog import BOOK_COLUMNS, CatalogSnapshot
+from recommendation import ContentRecommender
+from benchmarks.synthetic import generate_books
+
+def make_books(num_books, seed=0):
+    """The catalog of benchmarks.synthetic (the one the load benchmark imports), with ids 1..num_books."""
+    return [{'id': book_id, **book} for book_id, book in enumerate(generate_books(num_books, seed=seed), start=1)]
+
+def make_catalog(books):
+    return CatalogSnapshot(0, [tuple(book[name] for name in BOOK_COLUMNS) for book in books])
+
+def dense_score(recommender, liked_book_ids, k=10):
+    # The pre-V5 algorithm: full similarity matrix and a full argsort
+    cosine_sim = cosine_similarity(recommender.tfidf_matrix, recommender.tfidf_matrix)
+    books_data = [book.to_dict() for book in recommender.catalog.records]
+    user_scores = np.zeros(len(books_data))
+    for liked_id in liked_book_ids:
+        user_scores += cosine_sim[recommender.id_to_index[liked_id]]
+    result = []
+    for idx in user_scores.argsort()[::-1]:
+        if books_data[idx]['id'] not in liked_book_ids:
+            result.append(books_data[idx])
+            if len(result) >= k:
+                break
+    return result
+
+def measure(fn, repeat):
+    tracemalloc.start()
+    timings = []
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ms_median': 1000 * float(np.median(timings)), 'peak_kb': peak / 1024}
+
+def run(sizes, dense_limit, repeat, num_liked):
+    results = []
+    for num_books in sizes:
+        recommender = ContentRecommender(make_catalog(make_books(num_books)))
+        liked = random.Random(1).sample(range(1, num_books + 1), num_liked)
+        row = {'books': num_books, 'sparse': measure(lambda: recommender.score(liked), repeat)}
+        if num_books <= dense_limit:
+            row['dense'] = measure(lambda: dense_score(recommender, liked), max(1, repeat // 5))
+        results.append(row)
+        print(json.dumps(row))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--dense-limit', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--liked', type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.dense_limit, args.repeat, args.liked)
+
+if __name__ == '__main__':
+    main()
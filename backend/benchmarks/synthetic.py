@@ -0,0 +1,114 @@
+"""
+Synthetic catalogs and interaction histories for the load benchmarks.
+
+Books are generated in the shape real catalogs have: a few large categories
+and a long tail of small ones, descriptions whose lengths follow a log-normal
+distribution, heavy-tailed popularity, and text made of topic words mixed
+with common filler words. Interactions follow a Zipf distribution over the
+books (ranked by popularity) and over how active each user is.
+
+Everything is a generator driven by one seed, so a run can be reproduced
+exactly and catalogs of a million books never sit in memory as a whole.
+"""
+import numpy as np
+
+# The categories seed.py creates, from the largest to the smallest
+CATEGORIES = [
+    'Fiction', 'Mystery', 'Romance', 'Fantasy', 'Science Fiction', 'Thriller', 'Biography',
+    'History', 'Self-Help', 'Business', 'Horror', 'Psychology', 'Philosophy', 'Travel',
+]
+CATEGORY_SKEW = 1.1        # category k holds a share proportional to 1 / k**skew
+TOPICS_PER_CATEGORY = 20
+TOPIC_WORDS = 150          # words specific to each topic
+COMMON_WORDS = 400         # filler words shared by every description
+DESCRIPTION_WORDS = (60, 0.6, 8, 400)   # log-normal median, sigma, min, max
+POPULARITY_TAIL = 1.2      # Pareto shape of the popularity distribution
+INTERACTION_SKEW = 1.1     # Zipf exponent over books ranked by popularity
+FAVORITE_SHARE = 0.4       # the rest of the interactions are 'read'
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'ser', 'tan', 'vel', 'dor', 'ri', 'an', 'eth', 'or', 'yu', 'shi', 'bra', 'en', 'qui']
+
+def _vocabulary(size, rng):
+    # Pronounceable, distinct pseudo-words, so tokenizers and stemmers see words
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(_SYLLABLES, size=rng.integers(2, 5))))
+    # Shuffled so that no topic gets all the words sharing a prefix
+    return [str(word) for word in rng.permutation(sorted(words))]
+
+def category_weights():
+    weights = 1.0 / np.arange(1, len(CATEGORIES) + 1) ** CATEGORY_SKEW
+    return weights / weights.sum()
+
+def generate_books(num_books, seed=0, chunk_size=10000):
+    """Yields importer-ready book dicts (see importer.import_catalog)."""
+    rng = np.random.default_rng(seed)
+    num_topics = len(CATEGORIES) * TOPICS_PER_CATEGORY
+    # Filler words first, then TOPIC_WORDS words per topic
+    vocabulary = _vocabulary(COMMON_WORDS + num_topics * TOPIC_WORDS, rng)
+    num_authors = max(1, num_books // 8)
+    authors = [
+        f"{first.title()} {last.title()}"
+        for first, last in zip(rng.choice(vocabulary, size=num_authors), rng.choice(vocabulary, size=num_authors))
+    ]
+    median, sigma, min_words, max_words = DESCRIPTION_WORDS
+
+    for start in range(0, num_books, chunk_size):
+        n = min(chunk_size, num_books - start)
+        categories = rng.choice(len(CATEGORIES), size=n, p=category_weights())
+        topics = categories * TOPICS_PER_CATEGORY + rng.integers(0, TOPICS_PER_CATEGORY, size=n)
+        popularity = np.minimum(rng.pareto(POPULARITY_TAIL, size=n) * 50, 100000).astype(int)
+        ratings = np.round(np.clip(rng.normal(3.9, 0.5, size=n), 1.0, 5.0), 1)
+        author_ids = rng.zipf(1.5, size=n) % num_authors
+
+        # All words of the chunk at once: topic words are themselves
+        # Zipf-distributed, and about a third of the text is filler
+        lengths = np.clip(rng.lognormal(np.log(median), sigma, size=n), min_words, max_words).astype(int)
+        topic_base = np.repeat(COMMON_WORDS + topics * TOPIC_WORDS, lengths)
+        words = topic_base + (rng.zipf(1.3, size=topic_base.size) - 1) % TOPIC_WORDS
+        filler = rng.random(topic_base.size) < 0.35
+        words[filler] = rng.integers(0, COMMON_WORDS, size=int(filler.sum()))
+        word_ends = np.cumsum(lengths).tolist()
+
+        title_lengths = rng.integers(1, 5, size=n)
+        title_words = (np.repeat(COMMON_WORDS + topics * TOPIC_WORDS, title_lengths)
+                       + rng.integers(0, TOPIC_WORDS, size=title_lengths.sum()))
+        title_ends = np.cumsum(title_lengths).tolist()
+
+        words, title_words = words.tolist(), title_words.tolist()
+        word_start = title_start = 0
+        for i in range(n):
+            description = ' '.join([vocabulary[w] for w in words[word_start:word_ends[i]]])
+            title = ' '.join([vocabulary[w] for w in title_words[title_start:title_ends[i]]])
+            word_start, title_start = word_ends[i], title_ends[i]
+            book_number = start + i + 1
+            yield {
+                # The number keeps (title, author), the importer's natural key, unique
+                'title': f"{title.title()} {book_number}",
+                'author': authors[author_ids[i]],
+                'category': CATEGORIES[categories[i]],
+                'cover_image_url': f"https://covers.example.com/{book_number}.jpg",
+                'rating': float(ratings[i]),
+                'popularity': int(popularity[i]),
+                'description': description.capitalize() + '.',
+            }
+
+def generate_interactions(book_ids_by_popularity, num_users, mean_per_user=10, seed=0, max_per_user=500):
+    """
+    Yields unique (user_id, book_id, interaction_type) tuples for users
+    1..num_users. Books are picked with Zipf probability by their rank in
+    `book_ids_by_popularity` (most popular first); user activity is Zipf too.
+    """
+    rng = np.random.default_rng(seed)
+    num_books = len(book_ids_by_popularity)
+    activity = np.minimum(rng.zipf(2.0, size=num_users), max_per_user)
+    activity = np.maximum(1, np.round(activity * mean_per_user / activity.mean())).astype(int)
+    for user_id, count in enumerate(activity, start=1):
+        count = min(count, num_books)
+        ranks = set()
+        while len(ranks) < count:
+            draws = rng.zipf(INTERACTION_SKEW, size=2 * count) - 1
+            ranks.update(int(r) for r in draws[draws < num_books][:count - len(ranks)])
+        for rank in ranks:
+            interaction_type = 'favorite' if rng.random() < FAVORITE_SHARE else 'read'
+            yield user_id, book_ids_by_popularity[rank], interaction_type
@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+# V5.0: Per-user recommendation result cache
+class LocalCacheBackend:
+    """In-process store: bounded LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """
+    Shared store for running several worker processes. Redis applies the TTL
+    and its own eviction policy, so evictions are not counted here.
+    """
+
+    def __init__(self, url, ttl_seconds=300, prefix='bookalemun:'):
+        import redis  # Optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl_seconds, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def size(self):
+        # Unknown: counting would SCAN the whole keyspace on every stats call,
+        # and a counter kept here would miss the keys Redis expires or evicts
+        return None
+
+
+class RecommendationCache:
+    """
+    Caches each user's top-k list. An entry only counts as a hit when it was
+    computed for the current catalog version, so a catalog change invalidates
+    every entry at once, while an interaction only drops that user's entry.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(user_id):
+        return f"rec:{user_id}"
+
+    def get(self, user_id, catalog_version):
+        entry = self.backend.get(self._key(user_id))
+        if entry is not None and entry['catalog_version'] == catalog_version:
+            self.hits += 1
+            return entry['books']
+        self.misses += 1
+        return None
+
+    def set(self, user_id, catalog_version, books):
+        self.backend.set(self._key(user_id), {'catalog_version': catalog_version, 'books': books})
+
+    def invalidate(self, user_id):
+        self.backend.delete(self._key(user_id))
+        self.invalidations += 1
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'size': self.backend.size(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+def init_recommendation_cache(app):
+    if app.config['RECOMMENDATION_CACHE_BACKEND'] == 'redis':
+        backend = RedisCacheBackend(
+            app.config['RECOMMENDATION_CACHE_REDIS_URL'],
+            ttl_seconds=app.config['RECOMMENDATION_CACHE_TTL'],
+        )
+    else:
+        backend = LocalCacheBackend(
+            max_entries=app.config['RECOMMENDATION_CACHE_SIZE'],
+            ttl_seconds=app.config['RECOMMENDATION_CACHE_TTL'],
+        )
+    app.extensions['recommendation_cache'] = RecommendationCache(backend)
+
+def get_recommendation_cache():
+    return current_app.extensions['recommendation_cache']
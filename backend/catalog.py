@@ -0,0 +1,174 @@
+import json
+import threading
+import numpy as np
+from sqlalchemy import select
+from extensions import db
+from models import Book, CatalogVersion
+
+# Column order of every row the catalog layer loads; these are the public book fields
+BOOK_COLUMNS = ('id', 'title', 'author', 'cover_image_url', 'category', 'rating', 'popularity', 'description')
+# Loaded as well, but internal (not part of the JSON)
+EXTRA_COLUMNS = ('category_id',)
+# Body of every empty list
+EMPTY_JSON_ARRAY = b'[]'
+
+# Run on nearly every request (see query_plans.py)
+CATALOG_VERSION_QUERY = select(CatalogVersion.version).where(CatalogVersion.id == 1)
+
+def get_catalog_version():
+    """
+    Returns the current catalog version.
+
+    The counter is maintained by triggers on the book table, so it changes on
+    every insert, update or delete no matter which process or code path did it.
+    """
+    version = db.session.execute(CATALOG_VERSION_QUERY).scalar()
+    return version or 0
+
+def encode_json(value):
+    # Same bytes jsonify produces (sorted keys, compact separators)
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+
+
+class BookRecord:
+    """One book of the snapshot, with its JSON encoding computed once."""
+    __slots__ = BOOK_COLUMNS + EXTRA_COLUMNS + ('json',)
+
+    def __init__(self, row):
+        self.category_id = None
+        for name, value in zip(BOOK_COLUMNS + EXTRA_COLUMNS, row):
+            setattr(self, name, value)
+        self.json = encode_json(self.to_dict())
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in BOOK_COLUMNS}
+
+
+# V5.0: Shared in-memory catalog
+class CatalogSnapshot:
+    """
+    Read-only view of the whole book table for one catalog version.
+
+    Numeric columns the ranking code works on (rating, popularity) are NumPy
+    arrays; everything else lives in compact BookRecord objects. Endpoints
+    and the recommender read from here instead of going through the ORM.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.records = [BookRecord(row) for row in rows]
+        self.ids = np.fromiter((r.id for r in self.records), dtype=np.int64, count=len(self.records))
+        self.ratings = np.fromiter((r.rating for r in self.records), dtype=np.float64, count=len(self.records))
+        self.popularity = np.fromiter((r.popularity for r in self.records), dtype=np.int64, count=len(self.records))
+
+        # Book id -> position in the arrays/records
+        self.index = {book_id: pos for pos, book_id in enumerate(self.ids.tolist())}
+        # Category name / category id -> positions, in id order
+        by_category, by_category_id = {}, {}
+        for pos, record in enumerate(self.records):
+            by_category.setdefault(record.category, []).append(pos)
+            by_category_id.setdefault(record.category_id, []).append(pos)
+        self.by_category = {key: np.array(value, dtype=np.int64) for key, value in by_category.items()}
+        self.by_category_id = {key: np.array(value, dtype=np.int64) for key, value in by_category_id.items()}
+
+        self._json_cache = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, book_id):
+        pos = self.index.get(book_id)
+        return self.records[pos] if pos is not None else None
+
+    def popular(self, k=10):
+        """Top-k records by popularity (ties keep catalog order)."""
+        if len(self.records) > k:
+            candidates = np.argpartition(-self.popularity, k - 1)[:k]
+        else:
+            candidates = np.arange(len(self.records))
+        order = candidates[np.lexsort((candidates, -self.popularity[candidates]))]
+        return [self.records[pos] for pos in order]
+
+    def page(self, positions=None, after=None, limit=None):
+        """
+        Keyset pagination over `positions` (all books by default).
+
+        Returns the positions of the books with id > `after`, at most `limit`
+        of them, and the cursor for the next page (None on the last page).
+        Records are ordered by id, so both steps are binary searches.
+        """
+        start = 0
+        if after is not None:
+            first = int(np.searchsorted(self.ids, after, side='right'))
+            if positions is None:
+                start = first
+            elif len(positions):
+                start = int(np.searchsorted(positions, first))
+        if positions is None:
+            positions = range(len(self.records))
+        end = len(positions) if limit is None else min(start + limit, len(positions))
+        selected = positions[start:end]
+        next_cursor = int(self.ids[selected[-1]]) if end < len(positions) and len(selected) else None
+        return selected, next_cursor
+
+    def projected_json(self, positions, fields):
+        """
+        JSON bytes of the records at `positions`, holding only `fields` (a
+        tuple of column names). Encoded on every call: only the requested
+        page is ever encoded, and nothing per field set is kept.
+        """
+        records = self.records
+        for pos in positions:
+            record = records[pos]
+            yield encode_json({name: getattr(record, name) for name in fields})
+
+    def json_array(self, positions=None, key=None):
+        """
+        JSON array body for the given positions (all books by default).
+        Bodies requested with a `key` are built once per snapshot and reused;
+        empty lists share one constant body and are never cached.
+        """
+        if positions is not None and not len(positions):
+            return EMPTY_JSON_ARRAY
+        if key is not None and key in self._json_cache:
+            return self._json_cache[key]
+        records = self.records if positions is None else (self.records[pos] for pos in positions)
+        body = b'[' + b','.join(record.json for record in records) + b']'
+        if key is not None:
+            self._json_cache[key] = body
+        return body
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def load_book_rows():
+    # Core tuple select: no ORM identity map, no per-row instance state
+    columns = [Book.__table__.c[name] for name in BOOK_COLUMNS + EXTRA_COLUMNS]
+    return db.session.execute(select(*columns).order_by(Book.id)).all()
+
+def get_catalog():
+    """
+    Returns the shared CatalogSnapshot, reloading it only when the catalog
+    version has changed since it was built. One request reloads it while the
+    others keep getting the previous snapshot; they only wait for the first.
+    """
+    global _snapshot
+
+    # Read the version *before* loading rows: if the catalog changes in between,
+    # the snapshot is tagged with the older version and simply reloaded next time.
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    if not _snapshot_lock.acquire(blocking=snapshot is None):
+        # Another request is reloading it: serve the previous version meanwhile
+        return snapshot
+    try:
+        # Another request may have reloaded it while we waited for the lock
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = CatalogSnapshot(version, load_book_rows())
+        return _snapshot
+    finally:
+        _snapshot_lock.release()
@@ -0,0 +1,332 @@
+import logging
+import threading
+import time
+import numpy as np
+from flask import current_app
+from scipy.sparse import csr_matrix, diags
+from sqlalchemy import select
+from extensions import db
+from models import UserInteraction, UserInteractionChange
+
+logger = logging.getLogger(__name__)
+
+# How much each interaction type counts towards "this user likes this book"
+INTERACTION_WEIGHTS = {'favorite': 1.0, 'read': 0.5}
+
+# Incremental changes are folded into the CSR matrix once this many are pending
+FOLD_THRESHOLD = 200000
+# sync() re-reads users changed this many seconds before the previous sync,
+# to cover changes stamped just before it but committed just after
+SYNC_OVERLAP = 2.0
+
+
+def changed_users_query(since):
+    # Users whose interactions changed at or after `since` (a Unix timestamp)
+    return select(UserInteractionChange.user_id).where(UserInteractionChange.changed_at >= since)
+
+# V5.0: Item-Item Collaborative Filtering
+class ItemItemCF:
+    """
+    Keeps a sparse item-item co-occurrence matrix over user histories.
+
+    A user's history maps book_id -> weight (the summed weights of the
+    interaction types they have with it). For every pair of books i, j in
+    one history the matrix holds sum(w_i * w_j), so adding or removing one
+    interaction only touches the pairs it forms with the rest of that user's
+    history: O(history), never O(total interactions).
+
+    The matrix is a scipy CSR matrix (float32: every value is a multiple of
+    0.25, so sums stay exact) over the books that appear in any history;
+    book_ids[k] is the book of row and column k. Changing the structure of a
+    CSR matrix costs O(nnz), so incremental changes are collected as
+    (row, column, delta) triples and folded in once FOLD_THRESHOLD of them
+    are pending; scoring reads both. The diagonal (sum of w^2 per book) is
+    kept apart in item_norms.
+
+    The engine lives in one process. Each process of a multi-worker server
+    has its own and only records the toggles it serves itself; sync() brings
+    in the changes made by the others (see init_cf_engine).
+    """
+
+    def __init__(self, weights=None):
+        self.weights = weights or INTERACTION_WEIGHTS
+        self.ready = threading.Event()      # set once the first build is done
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._replay = None                 # events recorded while a rebuild runs
+        self.synced_at = 0.0
+        self._install(*self._build([]))
+
+    def _build(self, rows):
+        """State for (user_id, book_id, interaction_type) rows, in bulk."""
+        histories = {}
+        for user_id, book_id, interaction_type in rows:
+            histories.setdefault(user_id, {}).setdefault(book_id, set()).add(interaction_type)
+
+        book_ids = np.array(sorted({book_id for history in histories.values() for book_id in history}), dtype=np.int64)
+        index = {book_id: k for k, book_id in enumerate(book_ids.tolist())}
+        user_rows, columns, values = [], [], []
+        for row, history in enumerate(histories.values()):
+            for book_id, types in history.items():
+                user_rows.append(row)
+                columns.append(index[book_id])
+                values.append(self._weight(types))
+
+        # C = H.T @ H over the users x books history matrix H; its diagonal
+        # holds the norms and is moved out of the matrix
+        size = max(len(book_ids), 1)
+        h = csr_matrix(
+            (np.array(values, dtype=np.float32), (user_rows, columns)), shape=(len(histories), size)
+        )
+        cooccurrence = (h.T @ h).tocsr()
+        item_norms = cooccurrence.diagonal().astype(np.float64)
+        cooccurrence = (cooccurrence - diags(cooccurrence.diagonal())).tocsr()
+        cooccurrence.eliminate_zeros()
+        ids = np.zeros(size, dtype=np.int64)
+        ids[:len(book_ids)] = book_ids
+        return histories, ids, index, cooccurrence, item_norms
+
+    def _install(self, histories, ids, index, cooccurrence, item_norms):
+        self.histories = histories          # user_id -> {book_id: set of types}
+        self._ids = ids                     # row/column -> book_id, with spare capacity
+        self._index = index                 # book_id -> row/column
+        self.cooccurrence = cooccurrence
+        self.item_norms = item_norms
+        self._pending = ([], [], [])        # rows, columns, deltas
+        self._pending_matrix = None
+
+    @property
+    def book_ids(self):
+        return self._ids[:len(self._index)]
+
+    def _weight(self, types):
+        return sum(self.weights.get(t, 0.0) for t in types)
+
+    def _column(self, book_id):
+        column = self._index.get(book_id)
+        if column is None:
+            column = self._index[book_id] = len(self._index)
+            if column == len(self._ids):
+                self._grow()
+            self._ids[column] = book_id
+        return column
+
+    def _grow(self):
+        # Capacity doubles, so new books cost O(1) amortised
+        self._fold()
+        capacity = 2 * len(self._ids)
+        self._ids = np.concatenate((self._ids, np.zeros(capacity - len(self._ids), dtype=np.int64)))
+        self.item_norms = np.concatenate((self.item_norms, np.zeros(capacity - len(self.item_norms))))
+        self.cooccurrence.resize((capacity, capacity))
+
+    def _apply(self, user_id, book_id, old_weight, new_weight):
+        delta = new_weight - old_weight
+        if not delta:
+            return
+        column = self._column(book_id)
+        rows, columns, deltas = self._pending
+        for other_id, other_types in self.histories[user_id].items():
+            if other_id == book_id:
+                continue
+            other = self._column(other_id)
+            change = delta * self._weight(other_types)
+            rows += (column, other)
+            columns += (other, column)
+            deltas += (change, change)
+        self.item_norms[column] += new_weight ** 2 - old_weight ** 2
+        self._pending_matrix = None
+        if len(deltas) >= FOLD_THRESHOLD:
+            self._fold()
+
+    def _pending_deltas(self):
+        if self._pending_matrix is None:
+            rows, columns, deltas = self._pending
+            size = len(self._ids)
+            self._pending_matrix = csr_matrix(
+                (np.array(deltas, dtype=np.float32), (rows, columns)), shape=(size, size)
+            )
+        return self._pending_matrix
+
+    def _fold(self):
+        if not self._pending[2]:
+            return
+        cooccurrence = (self.cooccurrence + self._pending_deltas()).tocsr()
+        # Drop pairs that went back to zero so the matrix stays sparse
+        cooccurrence.eliminate_zeros()
+        self.cooccurrence = cooccurrence
+        self._pending = ([], [], [])
+        self._pending_matrix = None
+
+    def _record(self, user_id, book_id, interaction_type, action):
+        history = self.histories.setdefault(user_id, {})
+        types = history.get(book_id, set())
+        old_weight = self._weight(types)
+        if action == 'added':
+            types = types | {interaction_type}
+        else:
+            types = types - {interaction_type}
+
+        if types:
+            history[book_id] = types
+        else:
+            history.pop(book_id, None)
+        self._apply(user_id, book_id, old_weight, self._weight(types))
+
+    def record(self, user_id, book_id, interaction_type, action):
+        """Applies one 'added' or 'removed' interaction incrementally."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((user_id, book_id, interaction_type, action))
+            self._record(user_id, book_id, interaction_type, action)
+
+    def rebuild(self):
+        """
+        Recomputes everything from the UserInteraction table. The current
+        state keeps serving while it runs; interactions recorded meanwhile
+        are replayed on the new state (replaying one the table already had
+        changes nothing, since histories hold sets of types).
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._replay = []
+            started_at = time.time()
+            try:
+                rows = db.session.execute(
+                    select(UserInteraction.user_id, UserInteraction.book_id, UserInteraction.interaction_type)
+                ).all()
+                state = self._build(rows)
+            except BaseException:
+                with self._lock:
+                    self._replay = None
+                raise
+            # One critical section: a record() between taking the queue and
+            # installing the new state would be neither queued nor kept
+            with self._lock:
+                replay, self._replay = self._replay, None
+                self._install(*state)
+                for event in replay:
+                    self._record(*event)
+                self.synced_at = started_at
+
+    def sync(self):
+        """
+        Catches up with the interactions other processes wrote since the last
+        sync, using the per-user change times apply_toggles stores. Returns
+        the number of users re-read.
+        """
+        started_at = time.time()
+        # Held across the read: a toggle of this process committed after it
+        # is recorded after it, so the table never overwrites a newer change
+        with self._lock:
+            user_ids = db.session.scalars(changed_users_query(self.synced_at - SYNC_OVERLAP)).all()
+            current = {}
+            for lo in range(0, len(user_ids), 500):
+                for user_id, book_id, interaction_type in db.session.execute(
+                    select(UserInteraction.user_id, UserInteraction.book_id, UserInteraction.interaction_type)
+                    .where(UserInteraction.user_id.in_(user_ids[lo:lo + 500]))
+                ):
+                    current.setdefault(user_id, {}).setdefault(book_id, set()).add(interaction_type)
+
+            for user_id in user_ids:
+                history, target = self.histories.get(user_id, {}), current.get(user_id, {})
+                for book_id in history.keys() | target.keys():
+                    old, new = history.get(book_id, set()), target.get(book_id, set())
+                    for interaction_type in new - old:
+                        self._record(user_id, book_id, interaction_type, 'added')
+                    for interaction_type in old - new:
+                        self._record(user_id, book_id, interaction_type, 'removed')
+            self.synced_at = started_at
+        return len(user_ids)
+
+    def weighted_history(self, user_id):
+        """Returns {book_id: weight} for one user."""
+        with self._lock:
+            return {book_id: self._weight(types) for book_id, types in self.histories.get(user_id, {}).items()}
+
+    def _inverse_sqrt_norms(self, columns):
+        norms = self.item_norms[columns]
+        return np.divide(1.0, np.sqrt(norms), out=np.zeros_like(norms), where=norms > 0)
+
+    def score_user(self, user_id):
+        """
+        Returns {book_id: score} for books co-occurring with the user's history.
+        Co-occurrence counts are cosine-normalised so that very popular books
+        do not dominate every list.
+        """
+        with self._lock:
+            history = self.histories.get(user_id)
+            if not history:
+                return {}
+            columns = np.fromiter((self._index[book_id] for book_id in history), dtype=np.int64, count=len(history))
+            weights = np.fromiter((self._weight(types) for types in history.values()), dtype=np.float64,
+                                  count=len(history))
+            # One sparse row of weight / sqrt(norm) times the matrix: only
+            # the rows of the user's own books are read
+            profile = csr_matrix(
+                (weights * self._inverse_sqrt_norms(columns), (np.zeros(len(columns), dtype=np.int64), columns)),
+                shape=(1, len(self._ids)),
+            )
+            scores = profile @ self.cooccurrence
+            if self._pending[2]:
+                scores = scores + profile @ self._pending_deltas()
+            scores = scores.tocoo()
+            values = scores.data * self._inverse_sqrt_norms(scores.col)
+            keep = values != 0
+            return dict(zip(self._ids[scores.col[keep]].tolist(), values[keep].tolist()))
+
+    def cosine_matrix(self):
+        """(book_ids, matrix): the cosine-normalised co-occurrence matrix, rows and columns as in book_ids."""
+        with self._lock:
+            self._fold()
+            size = len(self._index)
+            scale = diags(self._inverse_sqrt_norms(np.arange(size)))
+            return self.book_ids.copy(), (scale @ self.cooccurrence[:size, :size] @ scale).tocsr()
+
+
+def _maintain(app, engine):
+    # Runs in its own thread: the first build, then a sync every CF_SYNC_SECONDS
+    interval = app.config['CF_SYNC_SECONDS']
+    with app.app_context():
+        try:
+            engine.rebuild()
+        except Exception:
+            logger.exception("Building the collaborative model failed; it starts empty")
+        finally:
+            engine.ready.set()
+            db.session.remove()
+        while interval:
+            time.sleep(interval)
+            try:
+                engine.sync()
+            except Exception:
+                logger.exception("Syncing the collaborative model failed")
+            finally:
+                db.session.remove()
+
+def init_cf_engine(app):
+    """
+    Creates the app's engine and builds it in a background thread, so no
+    request pays for the build; until it is done, requests skip the
+    collaborative scores. Call once the tables exist.
+
+    Under a multi-process server every worker builds and keeps its own
+    engine (roughly 8 bytes per matrix entry each). The same thread then
+    syncs every CF_SYNC_SECONDS, which bounds how long a toggle served by one
+    worker stays invisible to the others; 0 turns syncing off, for a single
+    process.
+    """
+    engine = app.extensions['cf_engine'] = ItemItemCF()
+    threading.Thread(target=_maintain, args=(app, engine), name='cf-engine', daemon=True).start()
+
+def get_cf_engine(wait=False):
+    """The app's engine, or None while its first build runs (unless `wait`)."""
+    engine = current_app.extensions['cf_engine']
+    if wait:
+        engine.ready.wait()
+    elif not engine.ready.is_set():
+        return None
+    return engine
+
+def record_interaction(user_id, book_id, interaction_type, action):
+    # Recorded even while the first build runs: the build replays it
+    current_app.extensions['cf_engine'].record(int(user_id), int(book_id), interaction_type, action)
@@ -0,0 +1,62 @@
+import sys
+import click
+from query_plans import HOT_QUERIES, check_query_plans, explain
+from importer import import_catalog, read_records
+from seed import seed_data
+from precompute import precompute_all
+
+# V5.1: Flask CLI commands, e.g. `flask --app app check-query-plans`
+def register_commands(app):
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Fails if any hot query's plan contains a full scan or skips its index."""
+        failures = check_query_plans()
+        for name, (statement, _) in HOT_QUERIES.items():
+            status = 'FAIL' if name in failures else 'ok'
+            click.echo(f"[{status}] {name}: {' | '.join(explain(statement))}")
+            for problem in failures.get(name, []):
+                click.echo(f"    {problem}")
+        if failures:
+            sys.exit(1)
+
+    # V5.2: Catalog loading
+    @app.cli.command('seed')
+    @click.option('--reset', is_flag=True, help='Drop all tables (including users) before seeding.')
+    def seed_command(reset):
+        """Seeds the sample catalog if the database is empty."""
+        seed_data(reset=reset)
+        click.echo('Database seeded.' if reset else 'Seed checked.')
+
+    @app.cli.command('import-catalog')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+                  help='Input format (default: from the file extension).')
+    @click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction.')
+    def import_catalog_command(path, fmt, chunk_size):
+        """Streams books from a CSV/JSONL file and upserts them on (title, author)."""
+        def progress(stats):
+            click.echo(f"{stats['rows']} rows, {stats['rows'] / stats['seconds']:.0f} rows/s", err=True)
+
+        stats = import_catalog(read_records(path, fmt), chunk_size=chunk_size, progress=progress)
+        click.echo(
+            f"Imported {stats['rows']} rows ({stats['skipped']} skipped) in {stats['seconds']:.1f}s "
+            f"- {stats['rows_per_second']:.0f} rows/s"
+        )
+
+    # V5.4: Offline recommendation precomputation
+    @app.cli.command('precompute-recommendations')
+    @click.option('--k', default=10, show_default=True, help='Recommendations per user.')
+    @click.option('--chunk-size', default=256, show_default=True, help='Users per sparse matrix product.')
+    @click.option('--workers', default=None, type=int, help='Worker processes (default: CPU count).')
+    def precompute_command(k, chunk_size, workers):
+        """Computes and stores top-k recommendations for every user."""
+        def progress(done, total, seconds):
+            click.echo(f"{done}/{total} users, {done / seconds:.0f} users/s", err=True)
+
+        stats = precompute_all(k=k, chunk_size=chunk_size, workers=workers, progress=progress)
+        click.echo(
+            f"Precomputed {stats['users']} users ({stats['skipped']} without favorites skipped, "
+            f"{stats['changed']} changed while running left to online scoring) "
+            f"in {stats['seconds']:.1f}s - {stats['users_per_second']:.0f} users/s"
+        )
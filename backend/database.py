@@ -1,6 +1,107 @@
+import sqlite3
+from contextlib import contextmanager
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
 from extensions import db
+from migrations import run_migrations
+
+# The catalog version is a single counter row that SQLite bumps on every write
+# to the book table. Doing it with triggers means bulk/Core writes and other
+# worker processes are seen too, not just changes made through the ORM session.
+CATALOG_VERSION_DDL = [
+    "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+    """CREATE TRIGGER IF NOT EXISTS book_catalog_version_insert AFTER INSERT ON book
+       BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS book_catalog_version_update AFTER UPDATE ON book
+       BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS book_catalog_version_delete AFTER DELETE ON book
+       BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END""",
+    # V5.1: Keep book.category_id in step with the free-text category name
+    """CREATE TRIGGER IF NOT EXISTS book_category_id_insert AFTER INSERT ON book
+       WHEN NEW.category_id IS NULL
+       BEGIN UPDATE book SET category_id = (SELECT id FROM category WHERE name = NEW.category)
+             WHERE id = NEW.id; END""",
+    """CREATE TRIGGER IF NOT EXISTS book_category_id_update AFTER UPDATE OF category ON book
+       BEGIN UPDATE book SET category_id = (SELECT id FROM category WHERE name = NEW.category)
+             WHERE id = NEW.id; END""",
+]
+
+# V5.6: Full-text index of the book table for /books/search. An external
+# content FTS5 table stores only the index (the text stays in book), and
+# these triggers keep it in step with every write, like the version counter.
+# The prefix index matches search.MIN_PREFIX_LENGTH (shorter prefixes are
+# never queried), and migration 5 rebuilds tables created with another one.
+SEARCH_INDEX_TABLE = """CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+           title, author, description,
+           content='book', content_rowid='id',
+           tokenize='unicode61 remove_diacritics 2', prefix='3')"""
+SEARCH_INDEX_TRIGGERS = {
+    'book_fts_insert': """CREATE TRIGGER IF NOT EXISTS book_fts_insert AFTER INSERT ON book
+       BEGIN INSERT INTO book_fts (rowid, title, author, description)
+             VALUES (NEW.id, NEW.title, NEW.author, NEW.description); END""",
+    'book_fts_delete': """CREATE TRIGGER IF NOT EXISTS book_fts_delete AFTER DELETE ON book
+       BEGIN INSERT INTO book_fts (book_fts, rowid, title, author, description)
+             VALUES ('delete', OLD.id, OLD.title, OLD.author, OLD.description); END""",
+    'book_fts_update': """CREATE TRIGGER IF NOT EXISTS book_fts_update AFTER UPDATE OF title, author, description ON book
+       BEGIN INSERT INTO book_fts (book_fts, rowid, title, author, description)
+             VALUES ('delete', OLD.id, OLD.title, OLD.author, OLD.description);
+             INSERT INTO book_fts (rowid, title, author, description)
+             VALUES (NEW.id, NEW.title, NEW.author, NEW.description); END""",
+}
+SEARCH_INDEX_DDL = [SEARCH_INDEX_TABLE, *SEARCH_INDEX_TRIGGERS.values()]
+
+@contextmanager
+def search_index_triggers_suspended(connection):
+    """
+    Drops the book_fts triggers for the duration of the block, inside the
+    caller's transaction, and puts them back before it commits. DDL is
+    transactional in SQLite and there is a single writer, so no other
+    connection ever sees the triggers missing (a rollback restores them as
+    well); the caller indexes its own writes instead (in bulk, see
+    importer.import_catalog).
+    """
+    for name in SEARCH_INDEX_TRIGGERS:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    yield
+    for statement in SEARCH_INDEX_TRIGGERS.values():
+        connection.execute(text(statement))
+
+@event.listens_for(db.metadata, 'after_create')
+def _install_catalog_triggers(target, connection, **kw):
+    # Runs after every create_all(), so existing databases get the triggers too.
+    for statement in CATALOG_VERSION_DDL + SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    # The FTS table is not part of the metadata; drop_all() must not leave a
+    # stale index behind for the next create_all() to pick up
+    connection.execute(text("DROP TABLE IF EXISTS book_fts"))
+
+# V5.3: Connection settings for concurrent use. WAL lets readers run alongside
+# the single writer, and synchronous=NORMAL only fsyncs at checkpoints
+# (still durable against application crashes, safe in WAL mode).
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",       # 64 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",     # 256 MB memory-mapped reads
+)
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 def init_db():
     # This function will now be called within an application context,
     # so it no longer needs to import or reference the 'app' object directly.
     db.create_all()
+    # create_all() never alters existing tables; bring older books.db files up to date
+    run_migrations()
@@ -0,0 +1,190 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+from sqlalchemy import and_, bindparam, select
+from sqlalchemy.dialects.sqlite import insert
+from extensions import db
+from models import PrecomputedRecommendation, UserInteraction, UserInteractionChange
+from cache import get_recommendation_cache
+from collaborative import record_interaction
+
+logger = logging.getLogger(__name__)
+
+interactions_table = UserInteraction.__table__
+
+# SQLite has a single writer anyway; holding this across the read-modify-write
+# keeps concurrent toggles of the same interaction from both seeing "absent"
+_write_lock = threading.Lock()
+
+def interaction_state_query(user_ids, book_ids):
+    # Every existing (user, book, type) among these users and books
+    return (
+        select(UserInteraction.user_id, UserInteraction.book_id, UserInteraction.interaction_type)
+        .where(UserInteraction.user_id.in_(user_ids), UserInteraction.book_id.in_(book_ids))
+    )
+
+# V5.3: Write path for interactions
+def apply_toggles(toggles):
+    """
+    Applies a list of (user_id, book_id, interaction_type) toggles in one
+    transaction and returns the action ('added' or 'removed') of each one.
+
+    Toggles are replayed in order against the current state, so toggling the
+    same book twice cancels out. Only the net changes are written: one SELECT
+    for the current state, one executemany INSERT and one executemany DELETE.
+
+    An exception means nothing was committed: the derived state is updated
+    after the commit and failures there are only logged, since the toggles
+    are already durable and must not be applied again.
+    """
+    if not toggles:
+        return []
+
+    user_ids = {user_id for user_id, _, _ in toggles}
+    book_ids = {book_id for _, book_id, _ in toggles}
+
+    with _write_lock:
+        # 1. Current state of every (user, book, type) the batch touches
+        existing = set(db.session.execute(interaction_state_query(user_ids, book_ids)).all())
+
+        # 2. Replay the toggles in memory
+        state = set(existing)
+        actions = []
+        for key in toggles:
+            if key in state:
+                state.discard(key)
+                actions.append('removed')
+            else:
+                state.add(key)
+                actions.append('added')
+        to_add, to_remove = state - existing, existing - state
+
+        # 3. Write the net difference
+        if to_add:
+            db.session.execute(
+                insert(interactions_table).on_conflict_do_nothing(),
+                [{'user_id': u, 'book_id': b, 'interaction_type': t} for u, b, t in to_add],
+            )
+        if to_remove:
+            db.session.execute(
+                interactions_table.delete().where(and_(
+                    interactions_table.c.user_id == bindparam('u'),
+                    interactions_table.c.book_id == bindparam('b'),
+                    interactions_table.c.interaction_type == bindparam('t'),
+                )),
+                [{'u': u, 'b': b, 't': t} for u, b, t in to_remove],
+            )
+        if to_add or to_remove:
+            # Precomputed lists of these users no longer reflect their history,
+            # and a precompute job already running must not store new ones
+            changed_users = {u for u, _, _ in to_add | to_remove}
+            db.session.execute(
+                PrecomputedRecommendation.__table__.delete()
+                .where(PrecomputedRecommendation.user_id.in_(changed_users))
+            )
+            change = insert(UserInteractionChange.__table__)
+            db.session.execute(
+                change.on_conflict_do_update(
+                    index_elements=['user_id'], set_={'changed_at': change.excluded.changed_at}
+                ),
+                [{'user_id': u, 'changed_at': time.time()} for u in changed_users],
+            )
+        db.session.commit()
+
+    # 4. Keep the derived state in step: CF matrix and cached recommendations
+    # (precomputed lists were already dropped in the same transaction)
+    _after_commit(user_ids, to_add, to_remove)
+    return actions
+
+def _after_commit(user_ids, to_add, to_remove):
+    try:
+        for user_id, book_id, interaction_type in to_add:
+            record_interaction(user_id, book_id, interaction_type, 'added')
+        for user_id, book_id, interaction_type in to_remove:
+            record_interaction(user_id, book_id, interaction_type, 'removed')
+    except Exception:
+        # The CF engine's next sync re-reads these users from the table
+        logger.exception("Recording committed interactions in the CF engine failed")
+    try:
+        cache = get_recommendation_cache()
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+    except Exception:
+        # Stale lists are served until RECOMMENDATION_CACHE_TTL expires them
+        logger.exception("Invalidating cached recommendations of users %s failed", sorted(user_ids))
+
+
+class GroupCommitter:
+    """
+    Coalesces single interactions that arrive within `window_ms` of each other
+    into one apply_toggles() call (one transaction, one fsync). Each request
+    thread waits on a Future for its own toggle's action.
+    """
+
+    def __init__(self, app, window_ms=5, max_batch=1000):
+        self.app = app
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, book_id, interaction_type):
+        future = Future()
+        self._queue.put(((user_id, book_id, interaction_type), future))
+        self._ensure_worker()
+        return future
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='interaction-group-commit', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Collect whatever else arrives within the window
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.window))
+            except queue.Empty:
+                pass
+            self._flush(batch)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                actions = apply_toggles([toggle for toggle, _ in batch])
+            except Exception:
+                # apply_toggles only raises before its commit, so nothing of the
+                # batch was written. Retry one toggle at a time, so one bad
+                # toggle only fails its own request
+                db.session.rollback()
+                for toggle, future in batch:
+                    try:
+                        future.set_result(apply_toggles([toggle])[0])
+                    except Exception as e:
+                        db.session.rollback()
+                        future.set_exception(e)
+                return
+            finally:
+                db.session.remove()
+        for (_, future), action in zip(batch, actions):
+            future.set_result(action)
+
+
+def init_group_commit(app):
+    window_ms = app.config['INTERACTION_GROUP_COMMIT_MS']
+    app.extensions['interaction_committer'] = GroupCommitter(app, window_ms) if window_ms else None
+
+def toggle_interaction(user_id, book_id, interaction_type):
+    """Toggles one interaction, through the group-commit buffer when enabled."""
+    committer = current_app.extensions.get('interaction_committer')
+    if committer is None:
+        return apply_toggles([(user_id, book_id, interaction_type)])[0]
+    return committer.submit(user_id, book_id, interaction_type).result(timeout=10)
@@ -0,0 +1,92 @@
+import heapq
+import threading
+from itertools import chain
+from sqlalchemy import select
+from extensions import db
+from models import Book, UserCategoryPreference
+from catalog import BOOK_COLUMNS, EXTRA_COLUMNS, BookRecord, get_catalog_version
+
+# V5.5: Cold-start recommendations from popularity leaderboards
+LEADERBOARD_SIZE = 100
+
+def leaderboard_query(category_id=None, size=LEADERBOARD_SIZE):
+    """Top `size` books by popularity, of one category or (None) overall."""
+    columns = [Book.__table__.c[name] for name in BOOK_COLUMNS + EXTRA_COLUMNS]
+    query = select(*columns).order_by(Book.popularity.desc(), Book.id).limit(size)
+    if category_id is not None:
+        query = query.where(Book.category_id == category_id)
+    return query
+
+class Leaderboards:
+    """
+    Top-N books by popularity, overall and per category, for one catalog version.
+
+    The ordering itself is maintained incrementally by SQLite in the
+    ix_book_popularity / ix_book_category_id_popularity indexes; this class
+    only keeps the top-N of each board it was asked for, loaded lazily with a
+    LIMIT walk over the index, so no request ever reads the whole catalog.
+    """
+
+    def __init__(self, version, size=LEADERBOARD_SIZE):
+        self.version = version
+        self.size = size
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def board(self, category_id=None):
+        """Records of the top-N books of a category (None: all books), best first."""
+        board = self._boards.get(category_id)
+        if board is None:
+            with self._lock:
+                board = self._boards.get(category_id)
+                if board is None:
+                    board = self._boards[category_id] = self._load(category_id)
+        return board
+
+    def _load(self, category_id):
+        return [BookRecord(row) for row in db.session.execute(leaderboard_query(category_id, self.size))]
+
+    def top(self, category_ids, k=10):
+        """
+        Merges the boards of the given categories into one top-k by popularity
+        (O(k) per category), topped up from the overall board if they run short.
+        """
+        merged = heapq.merge(
+            *(self.board(category_id) for category_id in category_ids),
+            key=lambda book: (-book.popularity, book.id),
+        )
+        result, seen = [], set()
+        for book in chain(merged, self.board(None)):
+            if book.id not in seen:
+                seen.add(book.id)
+                result.append(book)
+                if len(result) >= k:
+                    break
+        return result
+
+
+_leaderboards = None
+_leaderboards_lock = threading.Lock()
+
+def get_leaderboards():
+    """Returns the Leaderboards for the current catalog version."""
+    global _leaderboards
+    version = get_catalog_version()
+    leaderboards = _leaderboards
+    if leaderboards is None or leaderboards.version != version:
+        with _leaderboards_lock:
+            if _leaderboards is None or _leaderboards.version != version:
+                _leaderboards = Leaderboards(version)
+            leaderboards = _leaderboards
+    return leaderboards
+
+def preferred_categories_query(user_id):
+    return select(UserCategoryPreference.category_id).where(UserCategoryPreference.user_id == user_id)
+
+def get_preferred_category_ids(user_id):
+    return db.session.scalars(preferred_categories_query(user_id)).all()
+
+def cold_start_recommendations(user_id, k=10):
+    """Most popular books in the user's preferred categories (or overall)."""
+    books = get_leaderboards().top(get_preferred_category_ids(user_id), k)
+    return [book.to_dict() for book in books]
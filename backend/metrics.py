@@ -0,0 +1,254 @@
+import bisect
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# V5.7: Request, pipeline-stage and query instrumentation, exported in the
+# Prometheus text format by GET /metrics (routes/metrics.py)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects it."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs, then the sum and the count."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, pairs = 0, []
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            pairs.append(('+Inf' if bound == float('inf') else repr(bound), cumulative))
+        return pairs, total, count
+
+
+class Metrics:
+    """
+    Every metric of one app, kept in app.extensions['metrics'].
+    Histograms are created per label set on first use.
+    """
+
+    def __init__(self, slow_query_seconds=0.1):
+        self.slow_query_seconds = slow_query_seconds
+        self.request_latency = {}    # (method, route) -> Histogram
+        self.request_queries = {}    # (method, route) -> Histogram of queries per request
+        self.requests = {}           # (method, route, status) -> count
+        self.stage_latency = {}      # stage -> Histogram
+        self.query_latency = Histogram()
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def _histogram(self, family, key, buckets=LATENCY_BUCKETS):
+        histogram = family.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = family.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe_request(self, method, route, status, seconds, queries):
+        self._histogram(self.request_latency, (method, route)).observe(seconds)
+        self._histogram(self.request_queries, (method, route), QUERY_COUNT_BUCKETS).observe(queries)
+        key = (method, route, status)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def observe_stage(self, stage, seconds):
+        self._histogram(self.stage_latency, stage).observe(seconds)
+
+    def observe_query(self, statement, seconds):
+        self.query_latency.observe(seconds)
+        if seconds >= self.slow_query_seconds:
+            with self._lock:
+                self.slow_queries += 1
+            logger.warning("Slow query (%.1f ms): %s", seconds * 1000, ' '.join(statement.split())[:500])
+
+
+def _get_metrics():
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+@contextmanager
+def stage(name):
+    """Times a block as one stage of the recommendation pipeline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _get_metrics()
+        if metrics is not None:
+            metrics.observe_stage(name, time.perf_counter() - start)
+
+
+# Request hooks. Per-request state lives in g.metrics = [start time, query count].
+# The request is recorded at teardown, which also runs when an exception
+# propagates (debug mode) and after_request is skipped.
+def _before_request():
+    g.metrics = [time.perf_counter(), 0]
+    config = current_app.config
+    if config['PROFILE_REQUESTS'] or config['PROFILE_SAMPLE_RATE']:
+        _maybe_start_profiler(config)
+
+def _maybe_start_profiler(config):
+    wants_profile = config['PROFILE_REQUESTS'] and request.args.get('profile') == '1'
+    if wants_profile or random.random() < config['PROFILE_SAMPLE_RATE']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return
+        g.metrics_profiler = profiler
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        response.headers['X-Profile'] = _dump_profile(profiler, request.endpoint or 'unmatched')
+    return response
+
+def _teardown_request(exception):
+    state = g.pop('metrics', None)
+    if state is None:
+        return
+    # Still set if after_request was skipped: never leave it installed
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _dump_profile(profiler, request.endpoint or 'unmatched')
+
+    start, queries = state
+    req = request._get_current_object()
+    route = req.url_rule.rule if req.url_rule is not None else 'unmatched'
+    status = g.pop('metrics_status', 500)
+    current_app.extensions['metrics'].observe_request(
+        req.method, route, status, time.perf_counter() - start, queries
+    )
+
+def _dump_profile(profiler, endpoint):
+    # One .prof file per profiled request; open with pstats or snakeviz
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{id(profiler):x}.prof")
+    profiler.dump_stats(path)
+    return os.path.basename(path)
+
+
+def init_metrics(app):
+    """
+    Registers the request hooks and the query hooks on the app's engine;
+    call after db.init_app(app).
+    """
+    metrics = app.extensions['metrics'] = Metrics(slow_query_seconds=app.config['SLOW_QUERY_SECONDS'])
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    with app.app_context():
+        engine = db.engine
+
+    # The start time lives on the statement's execution context, so a failed
+    # statement (no after_cursor_execute) leaves nothing behind
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.observe_query(statement, time.perf_counter() - context.metrics_query_start)
+        state = g.get('metrics') if has_request_context() else None
+        if state is not None:
+            state[1] += 1
+
+
+# Prometheus text exposition
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _histogram_lines(name, histogram, **labels):
+    pairs, total, count = histogram.samples()
+    lines = [f"{name}_bucket{_labels(**labels, le=le)} {value}" for le, value in pairs]
+    suffix = _labels(**labels) if labels else ''
+    lines.append(f"{name}_sum{suffix} {total}")
+    lines.append(f"{name}_count{suffix} {count}")
+    return lines
+
+def render_prometheus(metrics, cache_stats=None):
+    """All metrics in the Prometheus text format (version 0.0.4)."""
+    lines = [
+        '# HELP http_requests_total Requests handled, by route and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (method, route, status), value in sorted(list(metrics.requests.items())):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {value}")
+
+    lines += [
+        '# HELP http_request_duration_seconds Request latency, by route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (method, route), histogram in sorted(list(metrics.request_latency.items())):
+        lines += _histogram_lines('http_request_duration_seconds', histogram, method=method, route=route)
+
+    lines += [
+        '# HELP http_request_db_queries SQL statements executed per request, by route.',
+        '# TYPE http_request_db_queries histogram',
+    ]
+    for (method, route), histogram in sorted(list(metrics.request_queries.items())):
+        lines += _histogram_lines('http_request_db_queries', histogram, method=method, route=route)
+
+    lines += [
+        '# HELP recommendation_stage_duration_seconds Time spent in each stage of get_recommendations.',
+        '# TYPE recommendation_stage_duration_seconds histogram',
+    ]
+    for name, histogram in sorted(list(metrics.stage_latency.items())):
+        lines += _histogram_lines('recommendation_stage_duration_seconds', histogram, stage=name)
+
+    lines += [
+        '# HELP db_query_duration_seconds SQL statement latency.',
+        '# TYPE db_query_duration_seconds histogram',
+        *_histogram_lines('db_query_duration_seconds', metrics.query_latency),
+        '# HELP db_slow_queries_total SQL statements slower than SLOW_QUERY_SECONDS.',
+        '# TYPE db_slow_queries_total counter',
+        f"db_slow_queries_total {metrics.slow_queries}",
+    ]
+
+    if cache_stats:
+        for name in ('hits', 'misses', 'evictions', 'invalidations'):
+            lines += [
+                f'# TYPE recommendation_cache_{name}_total counter',
+                f"recommendation_cache_{name}_total{_labels(backend=cache_stats['backend'])} {cache_stats[name]}",
+            ]
+        if cache_stats['size'] is not None:
+            lines += [
+                '# TYPE recommendation_cache_entries gauge',
+                f"recommendation_cache_entries{_labels(backend=cache_stats['backend'])} {cache_stats['size']}",
+            ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,96 @@
+import ast
+from sqlalchemy import text
+from extensions import db
+
+# V5.1: Schema revisions for existing books.db files.
+# create_all() only creates missing tables, so anything added to an existing
+# table (columns, indexes) needs a step here. The applied revision is kept in
+# SQLite's PRAGMA user_version; every step is written to be safe to re-run
+# on a database that create_all() has just built at the latest schema.
+
+def _columns(connection, table):
+    return {row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))}
+
+def _add_category_indexes(connection):
+    """Revision 1: book.category_id plus indexes for the hot lookups."""
+    if 'category_id' not in _columns(connection, 'book'):
+        connection.execute(text("ALTER TABLE book ADD COLUMN category_id INTEGER REFERENCES category(id)"))
+    connection.execute(text(
+        "UPDATE book SET category_id = (SELECT id FROM category WHERE category.name = book.category) "
+        "WHERE category_id IS NULL"
+    ))
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_book_category ON book (category)",
+        "CREATE INDEX IF NOT EXISTS ix_book_category_id ON book (category_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_category_name ON category (name)",
+        "CREATE INDEX IF NOT EXISTS ix_user_interaction_user_type "
+        "ON user_interaction (user_id, interaction_type, book_id)",
+    ):
+        connection.execute(text(statement))
+
+def _add_book_natural_key(connection):
+    """Revision 2: unique (title, author), the key catalog imports upsert on."""
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_book_title_author ON book (title, author)"))
+
+def _add_leaderboards_and_preferences(connection):
+    """
+    Revision 3: popularity indexes for the cold-start leaderboards, and the
+    stringified User.preferred_category_ids lists copied into
+    user_category_preference (created by create_all just before).
+    """
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_book_popularity ON book (popularity DESC)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_book_category_id_popularity ON book (category_id, popularity DESC)"
+    ))
+    rows = []
+    for user_id, raw in connection.execute(text("SELECT id, preferred_category_ids FROM user")):
+        try:
+            category_ids = {int(c) for c in ast.literal_eval(raw or '[]') or []}
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        rows.extend({'user_id': user_id, 'category_id': c} for c in category_ids)
+    if rows:
+        connection.execute(text(
+            "INSERT OR IGNORE INTO user_category_preference (user_id, category_id) VALUES (:user_id, :category_id)"
+        ), rows)
+
+def _build_search_index(connection):
+    """
+    Revision 4: fill book_fts (created by create_all just before) from the
+    existing books; the triggers keep it current from here on.
+    """
+    connection.execute(text("INSERT INTO book_fts (book_fts) VALUES ('rebuild')"))
+
+def _narrow_search_prefixes(connection):
+    """
+    Revision 5: recreate book_fts with the prefix index search.py queries
+    (3 characters only); a table built with other prefix sizes pays for
+    indexes no query reads on every write.
+    """
+    from database import SEARCH_INDEX_TABLE
+    sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'book_fts'")).scalar()
+    if sql is None or "prefix='3'" in sql:
+        return
+    connection.execute(text("DROP TABLE book_fts"))
+    connection.execute(text(SEARCH_INDEX_TABLE))
+    connection.execute(text("INSERT INTO book_fts (book_fts) VALUES ('rebuild')"))
+
+MIGRATIONS = [
+    (1, _add_category_indexes),
+    (2, _add_book_natural_key),
+    (3, _add_leaderboards_and_preferences),
+    (4, _build_search_index),
+    (5, _narrow_search_prefixes),
+]
+
+def run_migrations():
+    """Applies every revision newer than the database's user_version, in order."""
+    with db.engine.begin() as connection:
+        current = connection.execute(text("PRAGMA user_version")).scalar()
+        for revision, step in MIGRATIONS:
+            if revision > current:
+                step(connection)
+                connection.execute(text(f"PRAGMA user_version = {revision}"))
+                current = revision
+        # Refresh planner statistics so the new indexes are picked up
+        connection.execute(text("PRAGMA optimize"))
@@ -6,19 +6,44 @@ class Book(db.Model):
     author = db.Column(db.String(100), nullable=False)
     cover_image_url = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(50), nullable=False)
+    # V5.1: Filled from `category` by a trigger (see database.py)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     rating = db.Column(db.Float, nullable=False)
     popularity = db.Column(db.Integer, nullable=False)
     description = db.Column(db.Text, nullable=False)
 
+    # V5.1: Secondary indexes for the category lookups
+    # V5.2: (title, author) is the natural key the bulk importer upserts on
+    __table_args__ = (
+        db.Index('ix_book_category', 'category'),
+        db.Index('ix_book_category_id', 'category_id'),
+        db.Index('ix_book_title_author', 'title', 'author', unique=True),
+    )
+
+# V5.5: Popularity leaderboards. SQLite keeps these indexes sorted on every
+# write, so a top-N (per category or overall) is a short index walk.
+db.Index('ix_book_popularity', Book.popularity.desc())
+db.Index('ix_book_category_id_popularity', Book.category_id, Book.popularity.desc())
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
 
+    # V5.1: Books are matched to categories by name when category_id is filled in
+    __table_args__ = (db.Index('ix_category_name', 'name', unique=True),)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    # Storing category preferences as a simple JSON string list "[1, 2]"
+    # Legacy: preferences used to be stored here as a string list "[1, 2]".
+    # V5.5: they now live in UserCategoryPreference; kept for old databases.
     preferred_category_ids = db.Column(db.String(200), default="[]")
 
+# V5.5: One row per (user, preferred category), so preferences can be queried
+class UserCategoryPreference(db.Model):
+    __tablename__ = 'user_category_preference'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+
 # V2.0: Interaction Table for ML
 class UserInteraction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -27,4 +52,34 @@ class UserInteraction(db.Model):
     interaction_type = db.Column(db.String(20), nullable=False) # 'favorite' or 'read'
     
     # Ensure a user can't favorite the same book twice
-    __table_args__ = (db.UniqueConstraint('user_id', 'book_id', 'interaction_type', name='_user_book_interaction_uc'),)
+    # V5.1: plus an index in the order of the per-request "this user's favorites" lookup
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'book_id', 'interaction_type', name='_user_book_interaction_uc'),
+        db.Index('ix_user_interaction_user_type', 'user_id', 'interaction_type', 'book_id'),
+    )
+
+# V5.0: Bumped by SQLite triggers (see database.py) whenever the book table changes.
+# Anything derived from the catalog (e.g. the fitted TF-IDF model) is tagged with it.
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# V5.4: Top-k lists written in bulk by `flask precompute-recommendations`
+class PrecomputedRecommendation(db.Model):
+    __tablename__ = 'precomputed_recommendation'
+    user_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    catalog_version = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.Float, nullable=False)  # Unix timestamp
+
+# V5.4: When each user's interactions last changed, written by apply_toggles in
+# the same transaction. The precompute job skips users changed since it started.
+class UserInteractionChange(db.Model):
+    __tablename__ = 'user_interaction_change'
+    user_id = db.Column(db.Integer, primary_key=True)
+    changed_at = db.Column(db.Float, nullable=False)  # Unix timestamp
+
+    # Other processes' CF engines poll for recent changes (see collaborative.py)
+    __table_args__ = (db.Index('ix_user_interaction_change_changed_at', 'changed_at'),)
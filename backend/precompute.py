@@ -0,0 +1,198 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from flask import current_app
+from scipy.sparse import csr_matrix
+from sqlalchemy import delete, select
+from extensions import db
+from models import PrecomputedRecommendation, User, UserInteraction, UserInteractionChange
+from catalog import get_catalog
+from collaborative import get_cf_engine
+from recommendation import blend_scores, get_recommender, rank_rows
+
+# V5.4: Offline precomputation of every user's top-k
+#
+# Same scores as recommendation.get_recommendations, in matrix form:
+#   content = (P @ X) @ X.T   P: users x books favorites, X: TF-IDF matrix
+#   cf      = H @ C           H: users x books weighted histories,
+#                             C: cosine-normalised item-item co-occurrence
+# Users are scored in chunks (one sparse product per chunk) spread over a
+# process pool; the main process writes each chunk's results in bulk.
+
+_worker = {}
+
+def _init_worker(tfidf_matrix, cooccurrence, weights, num_books, k):
+    # Runs once per pool process, so the big matrices are sent only once
+    _worker.update(
+        tfidf=tfidf_matrix,
+        tfidf_t=tfidf_matrix.T.tocsr(),
+        cooccurrence=cooccurrence,
+        weights=weights,
+        num_books=num_books,
+        k=k,
+    )
+
+def _score_chunk(favorites, histories):
+    """Returns one array of top-k book rows per user row of the chunk."""
+    w = _worker
+    content = ((favorites @ w['tfidf']) @ w['tfidf_t']).tocsr()
+    use_cf = w['weights'].get('collaborative') and w['cooccurrence'] is not None
+    cf = (histories @ w['cooccurrence']).tocsr() if use_cf else None
+
+    results = []
+    for i in range(favorites.shape[0]):
+        liked_rows = favorites.indices[favorites.indptr[i]:favorites.indptr[i + 1]]
+        start, end = content.indptr[i], content.indptr[i + 1]
+        rows, scores = content.indices[start:end].astype(np.int64), content.data[start:end]
+        if cf is not None and cf.indptr[i + 1] > cf.indptr[i]:
+            cf_start, cf_end = cf.indptr[i], cf.indptr[i + 1]
+            rows, scores = blend_scores(
+                rows, scores, cf.indices[cf_start:cf_end].astype(np.int64), cf.data[cf_start:cf_end], w['weights']
+            )
+        results.append(rank_rows(rows, scores, liked_rows.astype(np.int64), w['num_books'], w['k']))
+    return results
+
+
+def _cooccurrence_matrix(engine, id_to_index, num_books):
+    # The CF engine's cosine-normalised matrix, re-indexed to catalog rows
+    # (P maps engine columns to catalog rows; books not in the catalog drop out)
+    book_ids, matrix = engine.cosine_matrix()
+    rows = np.fromiter((id_to_index.get(book_id, -1) for book_id in book_ids.tolist()), dtype=np.int64,
+                       count=len(book_ids))
+    known = np.flatnonzero(rows >= 0)
+    p = csr_matrix((np.ones(len(known)), (known, rows[known])), shape=(len(book_ids), num_books))
+    return (p.T @ matrix @ p).tocsr()
+
+def _history_matrix(user_index, entries, id_to_index, num_books):
+    # entries: (user_id, book_id, weight); duplicates are summed
+    rows, cols, values = [], [], []
+    for user_id, book_id, weight in entries:
+        if book_id in id_to_index and weight:
+            rows.append(user_index[user_id])
+            cols.append(id_to_index[book_id])
+            values.append(weight)
+    matrix = csr_matrix((values, (rows, cols)), shape=(len(user_index), num_books))
+    matrix.sum_duplicates()
+    return matrix
+
+def precompute_all(k=10, chunk_size=256, workers=None, progress=None):
+    """
+    Computes and stores the top-k list of every user with at least one
+    favorite (users without favorites get the cheap popularity fallback
+    online). Users whose interactions change while it runs are left out, so
+    a toggle is never overwritten by a list scored from the older history.
+    Returns counts and users/second.
+    """
+    start = time.perf_counter()
+    # Everything below is read after this instant
+    started_at = time.time()
+    recommender = get_recommender()
+    catalog = recommender.catalog
+    num_books = len(catalog)
+    weights = current_app.config.get('RECOMMENDER_WEIGHTS', {'content': 1.0, 'collaborative': 0.0})
+
+    # 1. Sparse user-profile matrices
+    favorites = db.session.execute(
+        select(UserInteraction.user_id, UserInteraction.book_id)
+        .where(UserInteraction.interaction_type == 'favorite')
+    ).all()
+    user_ids = sorted({user_id for user_id, _ in favorites})
+    user_index = {user_id: row for row, user_id in enumerate(user_ids)}
+    favorites_matrix = _history_matrix(
+        user_index, ((user_id, book_id, 1.0) for user_id, book_id in favorites), catalog.index, num_books
+    )
+
+    engine = get_cf_engine(wait=True)
+    cooccurrence, histories_matrix = None, None
+    if weights.get('collaborative'):
+        cooccurrence = _cooccurrence_matrix(engine, catalog.index, num_books)
+        histories_matrix = _history_matrix(user_index, (
+            (user_id, book_id, weight)
+            for user_id in user_ids
+            for book_id, weight in engine.weighted_history(user_id).items()
+        ), catalog.index, num_books)
+
+    stats = {'users': 0, 'changed': 0, 'skipped': len(set(db.session.scalars(select(User.id))) - set(user_ids))}
+    if not user_ids or recommender.tfidf_matrix is None:
+        stats.update(seconds=time.perf_counter() - start, users_per_second=0.0)
+        return stats
+
+    # 2. Score chunks in parallel; write each chunk as it comes back
+    chunks = [(lo, min(lo + chunk_size, len(user_ids))) for lo in range(0, len(user_ids), chunk_size)]
+    workers = workers or os.cpu_count()
+    initargs = (recommender.tfidf_matrix, cooccurrence, weights, num_books, k)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        futures = [
+            pool.submit(
+                _score_chunk,
+                favorites_matrix[lo:hi],
+                histories_matrix[lo:hi] if histories_matrix is not None else None,
+            )
+            for lo, hi in chunks
+        ]
+        for (lo, hi), future in zip(chunks, futures):
+            stats['changed'] += _store_chunk(user_ids[lo:hi], future.result(), catalog, started_at)
+            stats['users'] += hi - lo
+            if progress:
+                progress(stats['users'], len(user_ids), time.perf_counter() - start)
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['users_per_second'] = stats['users'] / stats['seconds']
+    return stats
+
+def _store_chunk(user_ids, results, catalog, started_at):
+    """
+    Replaces the stored lists of a chunk of users, except for the users whose
+    interactions changed after `started_at`; returns how many those were.
+    """
+    # The DELETE takes SQLite's write lock first, so no toggle can commit
+    # between the check for changed users and the INSERT
+    db.session.execute(delete(PrecomputedRecommendation).where(PrecomputedRecommendation.user_id.in_(user_ids)))
+    changed = set(db.session.scalars(
+        select(UserInteractionChange.user_id).where(
+            UserInteractionChange.user_id.in_(user_ids), UserInteractionChange.changed_at >= started_at,
+        )
+    ))
+    computed_at = time.time()
+    rows = [
+        {
+            'user_id': user_id,
+            'rank': rank,
+            'book_id': int(catalog.ids[book_row]),
+            'catalog_version': catalog.version,
+            'computed_at': computed_at,
+        }
+        for user_id, top_rows in zip(user_ids, results) if user_id not in changed
+        for rank, book_row in enumerate(top_rows)
+    ]
+    if rows:
+        db.session.execute(PrecomputedRecommendation.__table__.insert(), rows)
+    db.session.commit()
+    return len(changed)
+
+
+def precomputed_query(user_id, catalog_version, min_computed_at):
+    return (
+        select(PrecomputedRecommendation.book_id)
+        .where(
+            PrecomputedRecommendation.user_id == user_id,
+            PrecomputedRecommendation.catalog_version == catalog_version,
+            PrecomputedRecommendation.computed_at >= min_computed_at,
+        )
+        .order_by(PrecomputedRecommendation.rank)
+    )
+
+def get_precomputed(user_id, catalog_version):
+    """
+    Returns the stored top-k for this user, or None if there is none or it is
+    stale: computed for another catalog version, or older than
+    PRECOMPUTED_MAX_AGE seconds. Interactions delete the user's rows outright.
+    """
+    min_computed_at = time.time() - current_app.config.get('PRECOMPUTED_MAX_AGE', 86400)
+    book_ids = db.session.scalars(precomputed_query(user_id, catalog_version, min_computed_at)).all()
+    if not book_ids:
+        return None
+    catalog = get_catalog()
+    books = [catalog.get(book_id) for book_id in book_ids]
+    return [book.to_dict() for book in books if book is not None]
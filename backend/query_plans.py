@@ -0,0 +1,57 @@
+from sqlalchemy import text
+from extensions import db
+from catalog import CATALOG_VERSION_QUERY
+from collaborative import changed_users_query
+from interactions import interaction_state_query
+from leaderboards import LEADERBOARD_SIZE, leaderboard_query, preferred_categories_query
+from precompute import precomputed_query
+from recommendation import favorites_query
+
+# V5.1: Query-plan regression checks for the hot SQLite queries.
+# Each entry is a query the request path runs, built by the same helper the
+# code uses, and the index it must use; its EXPLAIN QUERY PLAN must not
+# contain a full table scan or a temporary sort. Whole-table loads that are
+# scans by design (the catalog snapshot, the CF rebuild) are not listed.
+HOT_QUERIES = {
+    'favorites_of_user': (favorites_query(1), 'ix_user_interaction_user_type'),
+    # The state SELECT of apply_toggles, for a batch of toggles
+    'interaction_toggle_state': (
+        interaction_state_query([1, 2, 3], [1, 2, 3]),
+        'sqlite_autoindex_user_interaction_1',
+    ),
+    'leaderboard_overall': (leaderboard_query(None, LEADERBOARD_SIZE), 'ix_book_popularity'),
+    'leaderboard_by_category': (leaderboard_query(1, LEADERBOARD_SIZE), 'ix_book_category_id_popularity'),
+    'preferences_of_user': (preferred_categories_query(1), 'sqlite_autoindex_user_category_preference_1'),
+    'precomputed_for_user': (precomputed_query(1, 1, 0.0), 'sqlite_autoindex_precomputed_recommendation_1'),
+    'catalog_version': (CATALOG_VERSION_QUERY, 'INTEGER PRIMARY KEY'),
+    # Polled by every process's CF engine (collaborative.init_cf_engine)
+    'changed_users_since': (changed_users_query(0.0), 'ix_user_interaction_change_changed_at'),
+}
+
+# Plan steps that mean the query reads more than it needs to
+BAD_STEPS = ('SCAN ', 'USE TEMP B-TREE')
+
+# Queries whose SCAN of the expected index is by design: they walk it in
+# order and stop at their LIMIT (a top-N read straight off the index)
+INDEX_WALKS = {'leaderboard_overall'}
+
+def explain(statement):
+    """Returns the detail lines of EXPLAIN QUERY PLAN for a SQLAlchemy statement."""
+    sql = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[3] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+def check_query_plans(queries=None):
+    """Returns {query name: offending plan lines} for every query that regressed."""
+    failures = {}
+    for name, (statement, expected_index) in (queries or HOT_QUERIES).items():
+        plan = explain(statement)
+        bad = [
+            step for step in plan
+            if step.startswith(BAD_STEPS)
+            and not (name in INDEX_WALKS and step.startswith('SCAN ') and expected_index in step)
+        ]
+        if not any(expected_index in step for step in plan):
+            bad.append(f"does not use {expected_index}")
+        if bad:
+            failures[name] = bad
+    return failures
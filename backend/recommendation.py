@@ -1,76 +1,242 @@
+import threading
 import numpy as np
+from flask import current_app
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from models import Book, UserInteraction
+from scipy.sparse import csr_matrix
+from sqlalchemy import select
+from extensions import db
+from models import UserInteraction
+from catalog import get_catalog
+from ann import IVFIndex
+from collaborative import get_cf_engine
+from leaderboards import cold_start_recommendations
+from metrics import stage
+
+
+# V5.0: Long-lived model, fitted once per catalog version
+class ContentRecommender:
+    """
+    Holds everything derived from the catalog that the scoring step needs:
+    the catalog snapshot (whose positions are the matrix rows), the fitted
+    TF-IDF vectorizer and the TF-IDF matrix. It is rebuilt only when the
+    catalog version changes.
+
+    With engine='ann' it also builds an IVFIndex over compressed embeddings and
+    only scores the books in the probed partitions instead of the whole catalog.
+    Those candidates are re-ranked with their exact TF-IDF scores unless
+    ann_options sets 'rerank' to False.
+    """
+
+    def __init__(self, catalog, engine='exact', ann_options=None):
+        self.version = catalog.version
+        self.catalog = catalog
+
+        # Map book IDs to their index in the matrix
+        self.id_to_index = catalog.index
+
+        # We combine Title, Category, and Description to create a rich "Content Tag" for each book
+        # "The Hobbit Fantasy A hobbit goes on an adventure..."
+        book_contents = [
+            f"{book.title} {book.category} {book.description}"
+            for book in catalog.records
+        ]
+
+        # Vectorization (Convert Text to Numbers)
+        # TF-IDF penalizes common words (like "the", "a") and boosts unique keywords
+        self.vectorizer = TfidfVectorizer(stop_words='english')
+        self.tfidf_matrix = self.vectorizer.fit_transform(book_contents) if book_contents else None
+
+        self.ann_index = None
+        self.ann_rerank = True
+        if engine == 'ann' and self.tfidf_matrix is not None:
+            ann_options = dict(ann_options or {})
+            self.ann_rerank = ann_options.pop('rerank', True)
+            self.ann_index = IVFIndex(self.tfidf_matrix, **ann_options)
+
+    def popular(self, k=10):
+        # Sort by popularity descending
+        return [book.to_dict() for book in self.catalog.popular(k)]
+
+    def score(self, liked_book_ids, k=10, cf_scores=None, weights=None):
+        """
+        Returns the top-k books most similar to the liked ones.
+        Candidates come from the ANN index when one is built, otherwise
+        from exact scoring over the whole catalog.
+
+        `cf_scores` ({book_id: score} from the collaborative engine) are blended
+        in using `weights` = {'content': ..., 'collaborative': ...}.
+        """
+        liked_rows = np.fromiter(
+            (self.id_to_index[book_id] for book_id in liked_book_ids if book_id in self.id_to_index),
+            dtype=np.int64,
+        )
+        if self.tfidf_matrix is None or not len(liked_rows):
+            return self.popular(k)
+
+        with stage('similarity'):
+            if self.ann_index is not None:
+                rows, scores = self.ann_index.candidates(liked_rows)
+                if self.ann_rerank:
+                    scores = (self.tfidf_matrix[rows] @ self._profile(liked_rows).T).toarray().ravel()
+            else:
+                rows, scores = self._exact_candidates(liked_rows)
+
+        if cf_scores:
+            with stage('blend'):
+                rows, scores = self._blend(rows, scores, cf_scores, weights or {})
+
+        with stage('rank'):
+            top_rows = rank_rows(rows, scores, liked_rows, len(self.catalog), k)
+            return [self.catalog.records[idx].to_dict() for idx in top_rows]
+
+    def _exact_candidates(self, liked_rows):
+        """
+        TF-IDF rows are L2-normalised, so the sum of cosine similarities to the
+        liked books equals one sparse product: (sum of liked rows) . every row.
+        Nothing of size N x N is ever built.
+        """
+        # Score every book against the profile; only books sharing a term
+        # with it come back as non-zero entries
+        scores = (self.tfidf_matrix @ self._profile(liked_rows).T).tocoo()
+        return scores.row, scores.data
+
+    def _blend(self, rows, scores, cf_scores, weights):
+        # {book_id: score} -> matrix rows, dropping books not in this catalog
+        cf_rows = np.fromiter(
+            (self.id_to_index.get(book_id, -1) for book_id in cf_scores), dtype=np.int64, count=len(cf_scores)
+        )
+        cf_values = np.fromiter(cf_scores.values(), dtype=np.float64, count=len(cf_scores))
+        known = cf_rows >= 0
+        return blend_scores(rows, scores, cf_rows[known], cf_values[known], weights)
+
+    def _profile(self, liked_rows):
+        # The user profile: a sparse 1 x V vector summing the liked rows
+        weights = csr_matrix(np.ones((1, len(liked_rows))))
+        return weights @ self.tfidf_matrix[liked_rows]
+
+
+def blend_scores(rows, scores, cf_rows, cf_values, weights):
+    """
+    Blends content and collaborative candidates. Each source is scaled to
+    [0, 1] by its best score before weighting, then scores for the same row
+    are summed.
+    """
+    all_rows = np.concatenate((rows, cf_rows))
+    all_scores = np.concatenate((
+        weights.get('content', 1.0) * _scaled(scores),
+        weights.get('collaborative', 0.0) * _scaled(cf_values),
+    ))
+    unique_rows, inverse = np.unique(all_rows, return_inverse=True)
+    return unique_rows, np.bincount(inverse, weights=all_scores)
+
+def rank_rows(rows, scores, liked_rows, num_books, k):
+    """Rank and Filter: the k best candidate rows that the user hasn't liked yet."""
+    top_rows = _top_k(rows, scores, liked_rows, k)
+    if len(top_rows) < k:
+        top_rows = _pad_rows(top_rows, liked_rows, num_books, k)
+    return top_rows
+
+def _scaled(scores):
+    top = scores.max() if len(scores) else 0.0
+    return scores / top if top > 0 else scores
+
+def _top_k(rows, scores, exclude_rows, k):
+    """
+    Vectorized top-k: drops excluded rows, picks the k best with argpartition
+    and only sorts those k. Ties go to the higher row, as a full descending
+    argsort would have done.
+    """
+    keep = ~np.isin(rows, exclude_rows)
+    rows, scores = rows[keep], scores[keep]
+    if len(rows) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[best], scores[best]
+    order = np.lexsort((-rows, -scores))
+    return rows[order]
+
+def _pad_rows(top_rows, exclude_rows, num_books, k):
+    # Fewer than k books share a term with the profile: fill up with zero-score
+    # books in the same order the old full argsort produced (highest row first)
+    taken = set(top_rows.tolist()) | set(exclude_rows.tolist())
+    padded = top_rows.tolist()
+    for idx in range(num_books - 1, -1, -1):
+        if len(padded) >= k:
+            break
+        if idx not in taken:
+            padded.append(idx)
+    return padded
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+
+def get_recommender():
+    """
+    Returns the shared ContentRecommender, building it on first use and
+    rebuilding it whenever the catalog version has moved on. Like the
+    snapshot, one request refits it while the others use the previous model.
+    """
+    global _recommender
+
+    # The snapshot is already reloaded on catalog changes; the model follows it
+    with stage('catalog'):
+        catalog = get_catalog()
+    recommender = _recommender
+    if recommender is not None and recommender.version == catalog.version:
+        return recommender
+
+    if not _recommender_lock.acquire(blocking=recommender is None):
+        # Another request is refitting it: serve the previous model meanwhile
+        return recommender
+    try:
+        # Another request may have rebuilt it while we waited for the lock
+        if _recommender is None or _recommender.version != catalog.version:
+            with stage('fit'):
+                _recommender = ContentRecommender(
+                    catalog,
+                    engine=current_app.config.get('RECOMMENDER_ENGINE', 'exact'),
+                    ann_options=current_app.config.get('ANN_OPTIONS'),
+                )
+        return _recommender
+    finally:
+        _recommender_lock.release()
+
+def favorites_query(user_id):
+    return (
+        select(UserInteraction.book_id)
+        .where(UserInteraction.user_id == user_id, UserInteraction.interaction_type == 'favorite')
+    )
 
 # V2.0: Machine Learning Based Recommendation Engine
-def get_recommendations(user_id, all_books_data):
+def get_recommendations(user_id):
     """
-    Generates content-based recommendations using TF-IDF and Cosine Similarity.
-    
+    Generates hybrid recommendations: content-based (TF-IDF and Cosine Similarity)
+    blended with item-item collaborative filtering.
+
     1. Analyzes book descriptions and categories.
     2. Builds a profile of what the user likes based on their interactions.
     3. Finds books mathematically similar to that profile.
+    4. Adds books that co-occur with the user's books in other users' histories.
     """
-    
-    # 1. Fetch user interactions (What did they like?)
-    user_likes = UserInteraction.query.filter_by(user_id=user_id, interaction_type='favorite').all()
-    liked_book_ids = [interaction.book_id for interaction in user_likes]
+    # V5.7: Each step is timed as a stage (see /metrics)
+    # Fetch user interactions (What did they like?)
+    with stage('interactions'):
+        liked_book_ids = db.session.scalars(favorites_query(user_id)).all()
 
     # If user hasn't liked anything yet, fallback to popularity (Hybrid approach)
+    # V5.5: from the leaderboards of their preferred categories, without touching the model
     if not liked_book_ids:
-        # Sort by popularity descending
-        return sorted(all_books_data, key=lambda x: x['popularity'], reverse=True)[:10]
+        with stage('cold_start'):
+            return cold_start_recommendations(user_id, 10)
 
-    # 2. Prepare Data for ML
-    # We combine Title, Category, and Description to create a rich "Content Tag" for each book
-    book_contents = []
-    for book in all_books_data:
-        # "The Hobbit Fantasy A hobbit goes on an adventure..."
-        content = f"{book['title']} {book['category']} {book['description']}"
-        book_contents.append(content)
-
-    # 3. Vectorization (Convert Text to Numbers)
-    # TF-IDF penalizes common words (like "the", "a") and boosts unique keywords
-    tfidf = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = tfidf.fit_transform(book_contents)
-
-    # 4. Calculate Similarity Matrix
-    # This creates a grid showing how similar every book is to every other book
-    cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
-
-    # 5. Generate User Recommendations
-    # We'll sum up the similarity scores of all books similar to the ones the user liked
-    
-    # Map book IDs to their index in the matrix
-    id_to_index = {book['id']: idx for idx, book in enumerate(all_books_data)}
-    
-    # Create an array to store aggregate scores for all books
-    num_books = len(all_books_data)
-    user_scores = np.zeros(num_books)
-
-    for liked_id in liked_book_ids:
-        if liked_id in id_to_index:
-            idx = id_to_index[liked_id]
-            # Add the similarity scores of this liked book to the total
-            user_scores += cosine_sim[idx]
-
-    # 6. Rank and Filter
-    # Get indices of books sorted by score (descending)
-    sorted_indices = user_scores.argsort()[::-1]
-
-    recommended_books = []
-    count = 0
-    for idx in sorted_indices:
-        book = all_books_data[idx]
-        
-        # Don't recommend books the user has already liked
-        if book['id'] in liked_book_ids:
-            continue
-            
-        recommended_books.append(book)
-        count += 1
-        if count >= 10: # Return top 10
-            break
-            
-    return recommended_books
+    recommender = get_recommender()
+
+    # Blend in what users with similar histories liked (Item-Item CF)
+    weights = current_app.config.get('RECOMMENDER_WEIGHTS', {'content': 1.0, 'collaborative': 0.0})
+    # (skipped while the engine's first build is still running)
+    with stage('collaborative'):
+        cf_engine = get_cf_engine() if weights.get('collaborative') else None
+        cf_scores = cf_engine.score_user(user_id) if cf_engine is not None else None
+
+    # Return top 10
+    return recommender.score(liked_book_ids, 10, cf_scores=cf_scores, weights=weights)
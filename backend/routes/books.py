@@ -1,50 +1,152 @@
-from flask import Blueprint, jsonify
-from models import Book, Category
+import zlib
+from flask import Blueprint, Response, jsonify, abort, request
+from models import Category
+from catalog import BOOK_COLUMNS, get_catalog
+from search import search_book_ids
 
 books_bp = Blueprint('books_bp', __name__)
 
+# V5.1: Paging limits for the list endpoints
+MAX_PAGE_SIZE = 1000
+STREAM_THRESHOLD = 200   # pages with more books than this are streamed
+STREAM_CHUNK = 100       # books per streamed chunk
+# V5.6: Result limits for /books/search
+DEFAULT_SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 100
+
+# V5.0: Book endpoints serve pre-encoded JSON from the shared catalog snapshot
+def json_response(body):
+    return Response(body, mimetype='application/json')
+
+def _parse_fields():
+    """Returns the requested projection in column order ('id' always included), or None."""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    requested = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = requested - set(BOOK_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in BOOK_COLUMNS if name in requested or name == 'id')
+
+def _stream(chunks):
+    # Yields the JSON array a few records at a time instead of joining it all
+    yield b'['
+    separator = b''
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == STREAM_CHUNK:
+            yield separator + b','.join(batch)
+            separator, batch = b',', []
+    if batch:
+        yield separator + b','.join(batch)
+    yield b']'
+
+def list_response(catalog, positions, cache_key):
+    """
+    Shared body of the list endpoints.
+
+    Query parameters:
+      after   - keyset cursor: only books with a larger id are returned
+      limit   - page size (at most MAX_PAGE_SIZE)
+      fields  - comma separated projection, e.g. fields=id,title,cover_image_url
+
+    The next cursor is sent in the X-Next-Cursor header, so the body stays a
+    plain JSON array. Responses carry a strong ETag derived from the catalog
+    version, and a matching If-None-Match gets an empty 304.
+    """
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        fields = _parse_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    variant = f"{request.path}|{after}|{limit}|{','.join(fields or ())}"
+    etag = f"v{catalog.version}-{zlib.crc32(variant.encode()):08x}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    page, next_cursor = catalog.page(positions, after, limit)
+    if fields is None and after is None and limit is None:
+        # Whole list, full records: the body is built once per snapshot
+        response = json_response(catalog.json_array(positions, key=cache_key))
+    else:
+        if fields is None:
+            chunks = (catalog.records[pos].json for pos in page)
+        else:
+            chunks = catalog.projected_json(page, fields)
+        if len(page) > STREAM_THRESHOLD:
+            response = Response(_stream(chunks), mimetype='application/json')
+        else:
+            response = json_response(b'[' + b','.join(chunks) + b']')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
 @books_bp.route('/books', methods=['GET'])
 def get_books():
-    books = Book.query.all()
-    return jsonify([{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'cover_image_url': book.cover_image_url,
-        'category': book.category,
-        'rating': book.rating,
-        'popularity': book.popularity,
-        'description': book.description
-    } for book in books])
+    return list_response(get_catalog(), None, 'all')
+
+# V5.6: Ranked full-text search over title, author and description
+@books_bp.route('/books/search', methods=['GET'])
+def search_books():
+    """
+    Query parameters:
+      q       - the search text; the last word also matches as a prefix
+      limit   - number of results (at most MAX_SEARCH_RESULTS)
+      fields  - comma separated projection, as on the list endpoints
+    """
+    q = request.args.get('q', '')
+    if not q.strip():
+        return jsonify({'error': 'Missing search query'}), 400
+    limit = request.args.get('limit', DEFAULT_SEARCH_RESULTS, type=int)
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    try:
+        fields = _parse_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The index ranks; the bodies come from the snapshot like every other list
+    catalog = get_catalog()
+    positions = [catalog.index[book_id] for book_id in search_book_ids(q, limit) if book_id in catalog.index]
+    if fields is None:
+        return json_response(catalog.json_array(positions))
+    return json_response(b'[' + b','.join(catalog.projected_json(positions, fields)) + b']')
 
 @books_bp.route('/books/<int:book_id>', methods=['GET'])
 def get_book(book_id):
-    book = Book.query.get_or_404(book_id)
-    return jsonify({
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'cover_image_url': book.cover_image_url,
-        'category': book.category,
-        'rating': book.rating,
-        'popularity': book.popularity,
-        'description': book.description
-    })
+    book = get_catalog().get(book_id)
+    if book is None:
+        abort(404)
+    return json_response(book.json)
 
 # V4.1: New efficient endpoint for fetching books by category
 @books_bp.route('/books/category/<string:category_name>', methods=['GET'])
 def get_books_by_category(category_name):
-    books = Book.query.filter_by(category=category_name).all()
-    return jsonify([{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'cover_image_url': book.cover_image_url,
-        'category': book.category,
-        'rating': book.rating,
-        'popularity': book.popularity,
-        'description': book.description
-    } for book in books])
+    catalog = get_catalog()
+    positions = catalog.by_category.get(category_name)
+    # Unknown names get an empty list; only real categories get a cached body
+    if positions is None:
+        return list_response(catalog, [], None)
+    return list_response(catalog, positions, ('category', category_name))
+
+# V5.1: Same list, matched on Category.id instead of the free-text name
+@books_bp.route('/books/category/<int:category_id>', methods=['GET'])
+def get_books_by_category_id(category_id):
+    catalog = get_catalog()
+    positions = catalog.by_category_id.get(category_id)
+    if positions is None:
+        return list_response(catalog, [], None)
+    return list_response(catalog, positions, ('category_id', category_id))
 
 
 @books_bp.route('/categories', methods=['GET'])
@@ -0,0 +1,11 @@
+from flask import Blueprint, Response, current_app
+from cache import get_recommendation_cache
+from metrics import render_prometheus
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+# V5.7: Prometheus scrape endpoint
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    body = render_prometheus(current_app.extensions['metrics'], get_recommendation_cache().stats())
+    return Response(body, mimetype='text/plain; version=0.0.4')
@@ -1,28 +1,51 @@
 from flask import Blueprint, jsonify
-from models import Book
+from catalog import get_catalog_version
+from cache import get_recommendation_cache
 from recommendation import get_recommendations as ml_get_recommendations
+from collaborative import get_cf_engine
+from precompute import get_precomputed
+from metrics import stage
 
 recommendations_bp = Blueprint('recommendations_bp', __name__)
 
 @recommendations_bp.route('/recommendations/<int:user_id>', methods=['GET'])
 def get_recommendations(user_id):
-    # 1. Fetch all books from DB
-    all_books = Book.query.all()
-
-    # Convert to dictionary format for the ML engine
-    all_books_data = [{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'cover_image_url': book.cover_image_url,
-        'category': book.category,
-        'rating': book.rating,
-        'popularity': book.popularity,
-        'description': book.description
-    } for book in all_books]
-
-    # 2. Ask the ML Brain for recommendations
-    # It will look at the user's interaction history in the DB
-    recommended_books_data = ml_get_recommendations(user_id, all_books_data)
-
-    return jsonify(recommended_books_data)
+    # 1. Serve the cached list if it was computed for the current catalog
+    # (/users/interact drops the entry when the user's history changes)
+    cache = get_recommendation_cache()
+    catalog_version = get_catalog_version()
+    recommended_books_data = cache.get(user_id, catalog_version)
+    source = 'cache'
+
+    if recommended_books_data is None:
+        # 2. Then the list stored by the offline precompute job, if still fresh
+        with stage('precomputed'):
+            recommended_books_data = get_precomputed(user_id, catalog_version)
+        source = 'precomputed'
+
+        if recommended_books_data is None:
+            # 3. Ask the ML Brain for recommendations (new or stale users)
+            # It keeps a fitted model of the catalog between requests and
+            # looks at the user's interaction history in the DB
+            recommended_books_data = ml_get_recommendations(user_id)
+            source = 'computed'
+
+        # Only on a miss: setting it on hits would slide the TTL forward
+        cache.set(user_id, catalog_version, recommended_books_data)
+
+    response = jsonify(recommended_books_data)
+    # Where the list came from, so latencies can be told apart (benchmarks/load.py)
+    response.headers['X-Recommendation-Source'] = source
+    return response
+
+# V5.0: Counters for sizing the recommendation cache
+@recommendations_bp.route('/recommendations/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(get_recommendation_cache().stats())
+
+# V5.0: Recovery path: recompute the item-item matrix from the interaction table
+@recommendations_bp.route('/recommendations/cf/rebuild', methods=['POST'])
+def rebuild_cf():
+    engine = get_cf_engine(wait=True)
+    engine.rebuild()
+    return jsonify({'message': 'Collaborative model rebuilt', 'users': len(engine.histories)}), 200
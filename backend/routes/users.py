@@ -1,24 +1,42 @@
 from flask import Blueprint, request, jsonify
 from extensions import db
-from models import User, UserInteraction, Book
+from sqlalchemy import delete
+from models import User, UserCategoryPreference
+from cache import get_recommendation_cache
+from interactions import apply_toggles, toggle_interaction
+from collaborative import INTERACTION_WEIGHTS
 
 users_bp = Blueprint('users_bp', __name__)
 
+def is_interaction_type(value):
+    # 'favorite' or 'read'; any other JSON value is rejected before it reaches the write path
+    return isinstance(value, str) and value in INTERACTION_WEIGHTS
+
 @users_bp.route('/users/preferences', methods=['POST'])
 def save_preferences():
     data = request.get_json()
     user_id = data.get('user_id')
     preferred_category_ids = data.get('preferred_category_ids')
 
-    user = User.query.get(user_id)
+    try:
+        user_id = int(user_id)
+        category_ids = {int(category_id) for category_id in preferred_category_ids or []}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid data'}), 400
+
+    user = db.session.get(User, user_id)
     if not user:
         # Create a new user if not exists (for demo simplicity)
-        user = User(id=user_id, preferred_category_ids=str(preferred_category_ids))
+        user = User(id=user_id)
         db.session.add(user)
-    else:
-        user.preferred_category_ids = str(preferred_category_ids)
-    
+
+    # V5.5: One row per preferred category instead of a stringified list
+    db.session.execute(delete(UserCategoryPreference).where(UserCategoryPreference.user_id == user_id))
+    db.session.add_all(UserCategoryPreference(user_id=user_id, category_id=c) for c in category_ids)
     db.session.commit()
+
+    # Cold-start recommendations depend on the preferences
+    get_recommendation_cache().invalidate(user_id)
     return jsonify({'message': 'Preferences saved successfully'}), 200
 
 # V2.0: Interaction API (Like/Read)
@@ -36,22 +54,49 @@ def interact_with_book():
     if not all([user_id, book_id, interaction_type]):
         return jsonify({'error': 'Missing data'}), 400
 
-    # Check if interaction already exists
-    existing = UserInteraction.query.filter_by(
-        user_id=user_id, book_id=book_id, interaction_type=interaction_type
-    ).first()
-
-    if existing:
-        # Toggle: If it exists, remove it (Unlike)
-        db.session.delete(existing)
-        action = 'removed'
-    else:
-        # Add new interaction
-        new_interaction = UserInteraction(
-            user_id=user_id, book_id=book_id, interaction_type=interaction_type
-        )
-        db.session.add(new_interaction)
-        action = 'added'
+    try:
+        user_id, book_id = int(user_id), int(book_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid data'}), 400
+    if not is_interaction_type(interaction_type):
+        return jsonify({'error': 'Invalid interaction type'}), 400
 
-    db.session.commit()
+    # Toggle: If it exists, remove it (Unlike), otherwise add it.
+    # This also updates the item-item matrix and drops this user's cached recommendations.
+    action = toggle_interaction(user_id, book_id, interaction_type)
     return jsonify({'message': f'Interaction {action}', 'action': action}), 200
+
+# V5.3: Bulk sync for the client's offline queue
+@users_bp.route('/users/interact/batch', methods=['POST'])
+def interact_with_books_batch():
+    """
+    Applies a queued list of toggles for one user in a single transaction.
+
+    Body: {"user_id": 1, "interactions": [{"book_id": 3, "type": "favorite"}, ...]}
+    The toggles are replayed in order, exactly as if they had been sent one
+    by one to /users/interact, and each one's action is returned in order.
+    """
+    data = request.get_json()
+    user_id = data.get('user_id')
+    interactions = data.get('interactions')
+
+    if not user_id or not isinstance(interactions, list):
+        return jsonify({'error': 'Missing data'}), 400
+
+    try:
+        toggles = [(int(user_id), int(item['book_id']), item['type']) for item in interactions]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid data'}), 400
+    if not all(interaction_type for _, _, interaction_type in toggles):
+        return jsonify({'error': 'Missing data'}), 400
+    if not all(is_interaction_type(interaction_type) for _, _, interaction_type in toggles):
+        return jsonify({'error': 'Invalid interaction type'}), 400
+
+    actions = apply_toggles(toggles)
+    return jsonify({
+        'message': f'{len(actions)} interactions applied',
+        'results': [
+            {'book_id': book_id, 'type': interaction_type, 'action': action}
+            for (_, book_id, interaction_type), action in zip(toggles, actions)
+        ],
+    }), 200
@@ -0,0 +1,47 @@
+import re
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from sqlalchemy import text
+from extensions import db
+
+# V5.6: Full-text book search over the book_fts index (see database.py)
+
+# bm25 weights of the indexed columns, in book_fts column order
+COLUMN_WEIGHTS = {'title': 10.0, 'author': 5.0, 'description': 1.0}
+# The last word is prefix-matched (search-as-you-type) once it has this many
+# characters. bm25 ranks every match, so shorter prefixes, which match a large
+# part of the catalog, are searched as whole words only
+MIN_PREFIX_LENGTH = 3
+
+_TOKEN = re.compile(r'\w+')
+
+SEARCH_SQL = text(f"""
+    SELECT rowid FROM book_fts
+    WHERE book_fts MATCH :match
+    ORDER BY bm25(book_fts, {', '.join(str(w) for w in COLUMN_WEIGHTS.values())}), rowid
+    LIMIT :limit
+""")
+
+def build_match_query(q):
+    """
+    Turns free user input into an FTS5 MATCH expression, or None if it has no
+    words. Every word is quoted, so FTS5 operators and punctuation in the
+    input are never interpreted; all words must match (implicit AND). The
+    last word also matches as a prefix unless the input ends with a space.
+    Stop words are dropped (the same list the recommender ignores): they match
+    most of the catalog and add almost nothing to the ranking.
+    """
+    tokens = _TOKEN.findall(q.lower())
+    if not tokens:
+        return None
+    tokens = [token for token in tokens if token not in ENGLISH_STOP_WORDS] or tokens
+    terms = [f'"{token}"' for token in tokens]
+    if not q[-1].isspace() and len(tokens[-1]) >= MIN_PREFIX_LENGTH:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_book_ids(q, limit=20):
+    """Ids of the best `limit` matches for `q`, most relevant first."""
+    match = build_match_query(q)
+    if match is None:
+        return []
+    return db.session.scalars(SEARCH_SQL, {'match': match, 'limit': limit}).all()
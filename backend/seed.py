@@ -1,24 +1,33 @@
 from extensions import db
 from models import Book, Category
+from database import init_db
 
-def seed_data():
-    """Seeds the database with initial, high-quality data."""
-    db.drop_all()
-    db.create_all()
+def seed_data(reset=False):
+    """
+    Seeds the database with initial, high-quality data.
 
-    # Seed Categories
-    categories = [
-        Category(name='Fiction'), Category(name='Science Fiction'),
-        Category(name='Mystery'), Category(name='History'),
-        Category(name='Biography'), Category(name='Fantasy'),
-        Category(name='Romance'), Category(name='Self-Help'),
-        Category(name='Business'), Category(name='Horror'),
-        Category(name='Thriller'), Category(name='Philosophy'),
-        Category(name='Psychology'), Category(name='Travel')
+    Categories and books are seeded independently: missing categories are
+    added by name, and books only go into an empty catalog, so calling it on
+    every startup is cheap and never touches existing data. `reset=True`
+    drops every table first (including users and their interactions) and
+    seeds from scratch.
+    """
+    if reset:
+        db.drop_all()
+        init_db()
+
+    # Seed Categories (names are unique, so only the missing ones are added)
+    names = [
+        'Fiction', 'Science Fiction', 'Mystery', 'History', 'Biography', 'Fantasy', 'Romance',
+        'Self-Help', 'Business', 'Horror', 'Thriller', 'Philosophy', 'Psychology', 'Travel',
     ]
-    db.session.bulk_save_objects(categories)
+    existing = set(db.session.scalars(db.select(Category.name).where(Category.name.in_(names))))
+    db.session.bulk_save_objects([Category(name=name) for name in names if name not in existing])
     db.session.commit()
 
+    if db.session.query(Book.id).first() is not None:
+        return
+
     # Seed Books with REAL image URLs
     books = [
         # Fiction